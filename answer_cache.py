@@ -0,0 +1,227 @@
+import os
+import json
+import atexit
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class AnswerCache:
+    """
+    Semantic cache of synthesized answers.
+
+    Entries are keyed on the (normalized) question embedding: a lookup
+    hits when a cached question has cosine >= threshold and its answer
+    is still valid, i.e. it was answered against the same KB version or
+    every file it cites still has the content hash it was answered from
+    (so a reload that leaves those files alone keeps the entry). Size is
+    bounded with LRU eviction, entries expire after `ttl` seconds, and
+    everything is persisted to a JSON file so the cache survives restarts.
+
+    Changes are written by a background thread at most every
+    `save_interval` seconds (and at exit), never while holding the lock
+    lookups need.
+    """
+
+    def __init__(self, path, threshold=0.95, max_entries=500, ttl=7 * 86400,
+                 save_interval=5.0):
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.save_interval = save_interval
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries = OrderedDict()           # key -> entry, LRU order
+        self._next_key = 0
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._saver = None
+        os.register_at_fork(after_in_child=self._reset_lock)
+        atexit.register(self.flush)
+
+        # similarity matrix over entries, rebuilt lazily after changes
+        self._keys = []
+        self._matrix = None
+
+        self._load()
+
+    def _reset_lock(self):
+        # forked answer workers (worker_pool.py) get fresh, unheld locks
+        # and start their own saver thread if they ever write
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._saver = None
+
+    # -----------------------------
+    # persistence
+    # -----------------------------
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        for entry in data.get("entries", []):
+            self._entries[self._next_key] = entry
+            self._next_key += 1
+
+    def _mark_dirty(self):
+        # caller holds _lock
+        self._dirty = True
+        if self._saver is None:
+            self._saver = threading.Thread(
+                target=self._save_forever, name="answer-cache-save", daemon=True,
+            )
+            self._saver.start()
+
+    def _save_forever(self):
+        while True:
+            time.sleep(self.save_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print("⚠️ Answer cache save failed:", repr(e))
+
+    def flush(self):
+        """Write pending changes now; the JSON is built outside the lock."""
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                self._dirty = False
+                entries = list(self._entries.values())
+
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                # per-process temp file: forked workers share the cache path
+                tmp = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp, "w") as f:
+                    json.dump({"entries": entries}, f)
+                os.replace(tmp, self.path)
+            except Exception:
+                with self._lock:
+                    self._dirty = True
+                raise
+
+    # -----------------------------
+    # internals
+    # -----------------------------
+
+    def _invalidate_matrix(self):
+        self._keys = []
+        self._matrix = None
+
+    def _ensure_matrix(self):
+        if self._matrix is None and self._entries:
+            self._keys = list(self._entries)
+            self._matrix = np.asarray(
+                [self._entries[k]["vec"] for k in self._keys],
+                dtype=np.float32,
+            )
+
+    def _drop(self, key):
+        del self._entries[key]
+        self.evictions += 1
+        self._invalidate_matrix()
+
+    def _expire(self):
+        now = time.time()
+        stale = [
+            k for k, e in self._entries.items() if now - e["created"] > self.ttl
+        ]
+        for k in stale:
+            self._drop(k)
+        return bool(stale)
+
+    @staticmethod
+    def _valid(entry, kb_version, file_hashes):
+        if entry["kb_version"] == kb_version:
+            return True
+        cited = entry.get("sources")
+        if not cited or file_hashes is None:
+            return False
+        return all(file_hashes.get(f) == h for f, h in cited.items())
+
+    # -----------------------------
+    # public API
+    # -----------------------------
+
+    def lookup(self, q_vec, kb_version, file_hashes=None):
+        """
+        Cached response dict for a similar question, or None.
+        `file_hashes` ({file_name: sha256} of the current KB) lets answers
+        from an older KB version through when their sources are unchanged.
+        """
+        with self._lock:
+            if self._expire():
+                self._mark_dirty()
+
+            self._ensure_matrix()
+            if self._matrix is None:
+                self.misses += 1
+                return None
+
+            sims = self._matrix @ np.asarray(q_vec, dtype=np.float32)
+            close = np.nonzero(sims >= self.threshold)[0]
+
+            for pos in close[np.argsort(-sims[close])]:
+                key = self._keys[pos]
+                if self._valid(self._entries[key], kb_version, file_hashes):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return dict(self._entries[key]["response"])
+
+            self.misses += 1
+            return None
+
+    def put(self, question, q_vec, response, kb_version, file_hashes=None):
+        # content hashes of the cited files; None -> valid for kb_version only
+        cited = None
+        if file_hashes is not None and response.get("sources"):
+            cited = {f: file_hashes.get(f) for f in response["sources"]}
+            if None in cited.values():
+                cited = None
+
+        with self._lock:
+            self._entries[self._next_key] = {
+                "question": question,
+                "vec": [round(float(x), 6) for x in q_vec],
+                "response": response,
+                "kb_version": kb_version,
+                "sources": cited,
+                "created": time.time(),
+            }
+            self._next_key += 1
+
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+            self._invalidate_matrix()
+            self._mark_dirty()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._invalidate_matrix()
+            self._mark_dirty()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,158 @@
+"""
+Offline / batch question answering.
+
+Reads questions from a JSONL file ({"question": ..., "id": ...} per line)
+or a local mbox, embeds and retrieves them in vectorized batches, runs
+the LLM step with bounded concurrency and streams one JSON answer per
+line as soon as it is ready. Answers also land in the answer cache, so
+a run over historical emails pre-warms it for the listener.
+
+    python batch_answer.py questions.jsonl -o answers.jsonl
+    python batch_answer.py archive.mbox --concurrency 4
+"""
+
+import sys
+import json
+import time
+import mailbox
+import argparse
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pyzmail
+
+from agent import (
+    answer_question,
+    answer_cache,
+    current_kb,
+    retrieve_batch,
+)
+from config import ANSWER_WORKERS, RETRIEVE_TOP_K
+from embeddings import embed
+from llm_gateway import PRIORITY_BATCH, configure_gateway, get_gateway
+
+
+# -----------------------------
+# Input readers
+# -----------------------------
+
+def read_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        for n, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            row = json.loads(line)
+            yield {
+                "id": row.get("id", n),
+                "sender": row.get("sender"),
+                "question": row["question"],
+            }
+
+
+def read_mbox(path):
+    from email_listener import extract_text, is_no_reply
+
+    for n, raw in enumerate(mailbox.mbox(path)):
+        msg = pyzmail.PyzMessage.factory(raw.as_bytes())
+        sender = (msg.get_addresses("from") or [("", "")])[0][1]
+        body = extract_text(msg).strip()
+
+        if is_no_reply(sender) or len(body) < 5:
+            continue
+
+        yield {
+            "id": msg.get("Message-ID") or n,
+            "sender": sender,
+            "question": body,
+        }
+
+
+def batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# -----------------------------
+# Batch runner
+# -----------------------------
+
+def run(items, out, concurrency=ANSWER_WORKERS, batch_size=64, k=RETRIEVE_TOP_K):
+    write_lock = threading.Lock()
+    done = failed = 0
+    started = time.time()
+
+    def answer_one(item, q_vec, hits, kb):
+        t0 = time.time()
+        response = answer_question(item["question"], kb, q_vec, hits,
+                                   priority=PRIORITY_BATCH)
+        return {**item, **response, "seconds": round(time.time() - t0, 3)}
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        for batch in batches(items, batch_size):
+            kb = current_kb()
+            questions = [item["question"] for item in batch]
+
+            # one embedding pass + one FAISS search for the whole batch
+            q_vecs = embed(questions)
+            hits = retrieve_batch(questions, k=k, kb=kb, q_vecs=q_vecs)
+
+            futures = {
+                pool.submit(answer_one, item, q_vec, h, kb): item
+                for item, q_vec, h in zip(batch, q_vecs, hits)
+            }
+
+            # stream answers as they complete
+            for fut in as_completed(futures):
+                try:
+                    row = fut.result()
+                    done += 1
+                except Exception as e:
+                    traceback.print_exc()
+                    row = {**futures[fut], "error": repr(e)}
+                    failed += 1
+
+                with write_lock:
+                    out.write(json.dumps(row, ensure_ascii=False) + "\n")
+                    out.flush()
+
+    elapsed = time.time() - started
+    print(f"✅ {done} answered, {failed} failed in {elapsed:.1f}s "
+          f"({done / elapsed if elapsed else 0:.2f} q/s)", file=sys.stderr)
+    print(f"🗄️ Answer cache: {answer_cache.stats()}", file=sys.stderr)
+    print(f"🤖 LLM gateway: {get_gateway().stats.summary()}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer questions in batch.")
+    parser.add_argument("input", help="questions .jsonl or an .mbox file")
+    parser.add_argument("-o", "--output", default="-",
+                        help="answers .jsonl (default: stdout)")
+    parser.add_argument("--format", choices=("jsonl", "mbox"),
+                        help="input format (default: from file extension)")
+    parser.add_argument("--concurrency", type=int, default=ANSWER_WORKERS,
+                        help="concurrent LLM calls (also the gateway limit)")
+    parser.add_argument("--batch-size", type=int, default=64,
+                        help="questions embedded/retrieved per batch")
+    parser.add_argument("--k", type=int, default=RETRIEVE_TOP_K)
+    args = parser.parse_args()
+
+    fmt = args.format or ("mbox" if args.input.endswith(".mbox") else "jsonl")
+    items = read_mbox(args.input) if fmt == "mbox" else read_jsonl(args.input)
+
+    # the gateway caps in-flight LLM calls too: raise its limit to match
+    configure_gateway(max_concurrency=args.concurrency)
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        run(items, out, args.concurrency, args.batch_size, args.k)
+    finally:
+        if out is not sys.stdout:
+            out.close()
@@ -0,0 +1,170 @@
+"""
+Latency / answer-quality comparison of the evidence selectors in evidence.py.
+
+Runs retrieval + graph expansion against the current index for each
+question, then every selector on the same hit matrix. Reported per
+selector: ms per call, chunks kept, mean question similarity and
+redundancy (mean pairwise similarity) of the kept chunks, and how many
+of the baseline's chunks it also keeps. The baseline is the legacy
+sklearn path, or the built-in kmeans when scikit-learn is not installed.
+
+Without --questions, queries are perturbed copies of indexed chunk
+vectors. With --llm (needs --questions and Ollama), answers are
+synthesized from each selection and compared with the baseline answer.
+
+    python bench_evidence.py
+    python bench_evidence.py --questions questions.jsonl --llm
+"""
+
+import time
+import argparse
+
+import numpy as np
+
+from config import RETRIEVE_TOP_K
+from embeddings import embed
+from evidence import SELECTORS
+
+
+def baseline_method():
+    """The legacy sklearn selector if scikit-learn is installed, else kmeans."""
+    try:
+        import sklearn  # noqa: F401
+    except ImportError:
+        return "kmeans"
+    return "sklearn"
+
+
+def hit_sets(kb, q_vecs, k):
+    """
+    (q_vec, hits, chunk_vecs) after retrieval + graph expansion per query
+    with hits, and the indices of those queries in q_vecs.
+    """
+    from agent import expand_hits
+
+    out, index = [], []
+    for i, (q_vec, hits) in enumerate(zip(q_vecs, kb.engine.search(q_vecs, k))):
+        if not hits:
+            continue
+        chunk_vecs = kb.engine.vectors([h.row for h in hits])
+        out.append((q_vec, *expand_hits(hits, chunk_vecs, q_vec, kb)))
+        index.append(i)
+    return out, index
+
+
+def perturbed_queries(kb, n, seed=1):
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, len(kb.chunks), n)
+    q = kb.engine.vectors(rows)
+    q = q + 0.1 * rng.normal(size=q.shape).astype(np.float32)
+    return q / np.linalg.norm(q, axis=1, keepdims=True)
+
+
+def selection_stats(sets, methods, repeats, baseline_name):
+    baseline = [SELECTORS[baseline_name](vecs, q) for q, _, vecs in sets]
+
+    rows = []
+    for method in methods:
+        fn = SELECTORS[method]
+
+        t0 = time.perf_counter()
+        for _ in range(repeats):
+            picks = [fn(vecs, q) for q, _, vecs in sets]
+        per_call = (time.perf_counter() - t0) / (repeats * len(sets))
+
+        kept, rel, red, overlap = [], [], [], []
+        for (q, _, vecs), keep, base in zip(sets, picks, baseline):
+            sel = vecs[keep]
+            kept.append(len(keep))
+            rel.append(float(np.mean(sel @ q)))
+            if len(keep) > 1:
+                sim = sel @ sel.T
+                red.append(float(sim[np.triu_indices(len(keep), 1)].mean()))
+            overlap.append(len(set(keep) & set(base)) / len(base))
+
+        rows.append((method, per_call, np.mean(kept), np.mean(rel),
+                     np.mean(red) if red else 0.0, np.mean(overlap)))
+    return rows
+
+
+def answer_stats(questions, sets, methods, baseline_name):
+    """Synthesize with each selection; compare with the baseline answer."""
+    from agent import synthesize
+
+    answers = {m: [] for m in methods}
+    seconds = {m: 0.0 for m in methods}
+    for question, (q, hits, vecs) in zip(questions, sets):
+        for method in methods:
+            keep = SELECTORS[method](vecs, q)
+            t0 = time.perf_counter()
+            answers[method].append(
+                synthesize(question, [hits[i] for i in keep], vecs[keep], q)
+            )
+            seconds[method] += time.perf_counter() - t0
+
+    base_vecs = embed([r["answer"] for r in answers[baseline_name]])
+    rows = []
+    for method in methods:
+        vecs = embed([r["answer"] for r in answers[method]])
+        sources = np.mean([
+            len(set(r["sources"]) & set(b["sources"])) / max(1, len(b["sources"]))
+            for r, b in zip(answers[method], answers[baseline_name])
+        ])
+        rows.append((method, seconds[method] / len(questions),
+                     float(np.mean((vecs * base_vecs).sum(axis=1))), sources))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--questions", help="questions .jsonl (batch_answer format)")
+    parser.add_argument("--queries", type=int, default=200,
+                        help="synthetic queries when no --questions are given")
+    parser.add_argument("--k", type=int, default=RETRIEVE_TOP_K)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--methods", default="sklearn,kmeans,mmr")
+    parser.add_argument("--llm", action="store_true",
+                        help="also synthesize answers and compare them")
+    args = parser.parse_args()
+
+    from agent import current_kb
+
+    kb = current_kb()
+    methods = args.methods.split(",")
+    baseline = baseline_method()
+    if baseline != "sklearn" and "sklearn" in methods:
+        print("⚠️ scikit-learn not installed: skipping sklearn, baseline is kmeans")
+        methods.remove("sklearn")
+    if baseline not in methods:
+        methods.insert(0, baseline)
+
+    questions = None
+    if args.questions:
+        from batch_answer import read_jsonl
+        questions = [item["question"] for item in read_jsonl(args.questions)]
+        q_vecs = embed(questions)
+    else:
+        q_vecs = perturbed_queries(kb, args.queries)
+
+    sets, index = hit_sets(kb, q_vecs, args.k)
+    if questions is not None:
+        # keep each question paired with its set
+        questions = [questions[i] for i in index]
+    print(f"📊 {len(sets)} queries, {np.mean([len(h) for _, h, _ in sets]):.1f} "
+          f"hits each after graph expansion")
+
+    print(f"{'selector':<10} {'ms/call':>8} {'kept':>5} {'q-sim':>6} "
+          f"{'redund':>7} {'vs ' + baseline:>10}")
+    for method, per_call, kept, rel, red, overlap in \
+            selection_stats(sets, methods, args.repeats, baseline):
+        print(f"{method:<10} {per_call * 1000:8.3f} {kept:5.1f} {rel:6.3f} "
+              f"{red:7.3f} {overlap:10.2f}")
+
+    if args.llm:
+        if questions is None:
+            parser.error("--llm needs --questions")
+
+        print(f"\n{'selector':<10} {'s/answer':>8} {'answer sim':>10} {'sources':>8}")
+        for method, secs, sim, sources in \
+                answer_stats(questions, sets, methods, baseline):
+            print(f"{method:<10} {secs:8.2f} {sim:10.3f} {sources:8.2f}")
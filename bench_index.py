@@ -0,0 +1,109 @@
+"""
+Recall-vs-latency report for the FAISS index types in index_factory.py.
+
+Uses the vectors of the current index (faiss_store/vector_store.faiss),
+or synthetic unit vectors with --synthetic N to project a larger KB.
+Queries are held-out perturbed copies of indexed vectors; recall@k is
+measured against exact inner-product search.
+
+    python bench_index.py
+    python bench_index.py --synthetic 200000 --queries 500 --k 10
+"""
+
+import os
+import time
+import argparse
+
+import faiss
+import numpy as np
+
+from config import FAISS_DIR
+from index_factory import INDEX_TYPES, make_index, configure_search, describe
+
+
+def load_vectors():
+    index = faiss.read_index(os.path.join(FAISS_DIR, "vector_store.faiss"))
+    configure_search(index)
+    vecs = index.reconstruct_n(0, index.ntotal)
+    return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+
+def synthetic_vectors(n, dim=384, clusters=256, seed=0):
+    """Clustered unit vectors (closer to real embeddings than pure noise)."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    vecs = centers[rng.integers(0, clusters, n)]
+    vecs += 0.6 * rng.normal(size=(n, dim)).astype(np.float32)
+    return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+
+def make_queries(vecs, n, seed=1):
+    rng = np.random.default_rng(seed)
+    q = vecs[rng.integers(0, len(vecs), n)]
+    q = q + 0.1 * rng.normal(size=q.shape).astype(np.float32)
+    return q / np.linalg.norm(q, axis=1, keepdims=True)
+
+
+def run(vecs, queries, k, kinds, nprobes, efs):
+    exact = faiss.IndexFlatIP(vecs.shape[1])
+    exact.add(vecs)
+    _, truth = exact.search(queries, k)
+
+    rows = []
+    for kind in kinds:
+        t0 = time.time()
+        index = make_index(vecs, kind)
+        index.add(vecs)
+        build = time.time() - t0
+
+        if "ivf" in kind:
+            settings = [dict(nprobe=p) for p in nprobes]
+        elif kind == "hnsw":
+            settings = [dict(ef_search=e) for e in efs]
+        else:
+            settings = [{}]
+
+        for params in settings:
+            configure_search(index, **params)
+
+            t0 = time.time()
+            _, found = index.search(queries, k)
+            per_query = (time.time() - t0) / len(queries)
+
+            recall = np.mean([
+                len(set(f) & set(t)) / k for f, t in zip(found, truth)
+            ])
+            rows.append((describe(index), build, per_query, recall))
+
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="benchmark N synthetic vectors instead of the KB")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--types", default=",".join(INDEX_TYPES[1:]))
+    parser.add_argument("--nprobe", default="1,4,8,32")
+    parser.add_argument("--ef-search", default="16,64,256")
+    args = parser.parse_args()
+
+    vecs = synthetic_vectors(args.synthetic) if args.synthetic else load_vectors()
+    vecs = np.ascontiguousarray(vecs, dtype=np.float32)
+    queries = make_queries(vecs, args.queries)
+    k = min(args.k, len(vecs))
+
+    print(f"📊 {len(vecs)} vectors x {vecs.shape[1]} dims, "
+          f"{len(queries)} queries, recall@{k}")
+
+    rows = run(
+        vecs, queries, k,
+        kinds=args.types.split(","),
+        nprobes=[int(x) for x in args.nprobe.split(",")],
+        efs=[int(x) for x in args.ef_search.split(",")],
+    )
+
+    print(f"{'index':<40} {'build s':>8} {'ms/query':>9} {'recall':>7}")
+    for name, build, per_query, recall in rows:
+        print(f"{name:<40} {build:8.2f} {per_query * 1000:9.3f} {recall:7.3f}")
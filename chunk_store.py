@@ -0,0 +1,136 @@
+"""
+Compact on-disk chunk table, written by ingest_kb.py next to the FAISS
+index and read by the agent instead of LlamaIndex's JSON docstore.
+
+Layout of faiss_store/chunk_store/ (row i == FAISS row i):
+
+    text.bin      UTF-8 chunk texts, concatenated
+    offsets.npy   int64[n + 1], text of row i is text.bin[off[i]:off[i+1]]
+    node_ids.npy  fixed-width bytes[n], LlamaIndex node ids
+    file_idx.npy  int32[n], index into files.json
+    prev.npy      int32[n], row of the previous chunk (-1: none)
+    next.npy      int32[n], row of the next chunk (-1: none)
+    files.json    distinct file names
+
+Everything is memory-mapped: opening the store does not read the texts,
+and a chunk's text is only decoded when a search returns its row.
+"""
+
+import os
+import json
+import mmap
+import shutil
+
+import numpy as np
+
+from config import FAISS_DIR
+from retrieval import Chunk, Hit
+
+
+STORE_DIR = os.path.join(FAISS_DIR, "chunk_store")
+
+
+class ChunkStore:
+    """Same interface as retrieval.ChunkTable, backed by mmap'd files."""
+
+    def __init__(self, path=STORE_DIR):
+        self.path = path
+
+        load = lambda name: np.load(os.path.join(path, name), mmap_mode="r")
+        self.offsets = load("offsets.npy")
+        self.file_idx = load("file_idx.npy")
+        self.prev = load("prev.npy")
+        self.next = load("next.npy")
+
+        with open(os.path.join(path, "files.json")) as f:
+            self.files = json.load(f)
+
+        # node ids are needed up front for the graph / citation lookups
+        self.node_ids = [nid.decode() for nid in load("node_ids.npy")]
+        self.row_of = {nid: i for i, nid in enumerate(self.node_ids)}
+
+        self._text_file = open(os.path.join(path, "text.bin"), "rb")
+        if self.offsets[-1] > 0:
+            self._text = mmap.mmap(self._text_file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._text = b""
+
+    @staticmethod
+    def exists(path=STORE_DIR):
+        return os.path.exists(os.path.join(path, "offsets.npy"))
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def text(self, row):
+        start, end = self.offsets[row], self.offsets[row + 1]
+        return self._text[start:end].decode("utf-8")
+
+    def chunk(self, row):
+        prev, nxt = int(self.prev[row]), int(self.next[row])
+        return Chunk(
+            self.node_ids[row],
+            self.text(row),
+            self.files[self.file_idx[row]],
+            self.node_ids[prev] if prev >= 0 else None,
+            self.node_ids[nxt] if nxt >= 0 else None,
+        )
+
+    def hit(self, node_id, score):
+        row = self.row_of[node_id]
+        return Hit(self.chunk(row), score, row)
+
+    def adjacent_pairs(self):
+        """(chunk, next chunk) id pairs for the graph's prev/next edges."""
+        rows = np.flatnonzero(np.asarray(self.next) >= 0)
+        return [(self.node_ids[r], self.node_ids[self.next[r]]) for r in rows]
+
+    # -----------------------------
+    # Export (ingest time)
+    # -----------------------------
+
+    @staticmethod
+    def write(chunks, path=STORE_DIR):
+        """
+        Write `chunks` (retrieval.Chunk objects in FAISS row order).
+        The store is built in a temp dir and swapped in, so a running
+        agent never sees a half-written one.
+        """
+        tmp = path + ".tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+
+        row_of = {c.node_id: i for i, c in enumerate(chunks)}
+        files = sorted({c.file_name for c in chunks})
+        file_row = {f: i for i, f in enumerate(files)}
+
+        offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+        with open(os.path.join(tmp, "text.bin"), "wb") as f:
+            for i, c in enumerate(chunks):
+                data = c.text.encode("utf-8")
+                f.write(data)
+                offsets[i + 1] = offsets[i] + len(data)
+
+        def rows(ids):
+            return np.asarray(
+                [row_of.get(nid, -1) if nid else -1 for nid in ids],
+                dtype=np.int32,
+            )
+
+        np.save(os.path.join(tmp, "offsets.npy"), offsets)
+        np.save(os.path.join(tmp, "node_ids.npy"),
+                np.asarray([c.node_id.encode() for c in chunks], dtype=np.bytes_))
+        np.save(os.path.join(tmp, "file_idx.npy"),
+                np.asarray([file_row[c.file_name] for c in chunks], dtype=np.int32))
+        np.save(os.path.join(tmp, "prev.npy"), rows(c.prev_id for c in chunks))
+        np.save(os.path.join(tmp, "next.npy"), rows(c.next_id for c in chunks))
+
+        with open(os.path.join(tmp, "files.json"), "w") as f:
+            json.dump(files, f)
+
+        old = path + ".old"
+        shutil.rmtree(old, ignore_errors=True)
+        if os.path.exists(path):
+            os.replace(path, old)
+        os.replace(tmp, path)
+        shutil.rmtree(old, ignore_errors=True)
@@ -12,8 +12,48 @@ GMAIL_APP_PASSWORD = os.getenv("GMAIL_APP_PASSWORD")
 
 IMAP_SERVER = "imap.gmail.com"
 
+# Seconds per IMAP IDLE round before it is re-issued (Gmail drops IDLE
+# after ~29 min), polling interval for servers without IDLE, UIDs per
+# FETCH command and the cap for reconnect backoff
+IMAP_IDLE_TIMEOUT = 300
+POLL_INTERVAL = 60
+FETCH_BATCH_SIZE = 50
+RECONNECT_BACKOFF_MAX = 300
+
 SMTP_SERVER = "smtp.gmail.com"
 SMTP_PORT = 587
+SMTP_STARTTLS = True
+
+# Pooled SMTP sessions: max open connections, seconds before an idle
+# session is dropped, and idle seconds after which it is NOOP-checked
+SMTP_POOL_SIZE = 2
+SMTP_IDLE_TIMEOUT = 120
+SMTP_NOOP_AFTER = 15
+
+# -----------------------------
+# Mail processing pipeline
+# -----------------------------
+# Worker threads per stage (answer workers = concurrent Ollama requests)
+PARSE_WORKERS = 1
+ANSWER_WORKERS = 2
+SEND_WORKERS = 1
+
+# Max emails buffered between two stages (backpressure)
+PIPELINE_QUEUE_SIZE = 16
+
+# Answer worker processes (worker_pool.py), forked after the index and
+# models are loaded so they share them copy-on-write. 0 = answer in the
+# listener's own threads. Keep ANSWER_WORKERS >= ANSWER_PROCESSES so
+# every worker process gets a job. Each worker has its own LLM gateway,
+# so Ollama sees up to ANSWER_PROCESSES x LLM_MAX_CONCURRENCY requests.
+ANSWER_PROCESSES = 0
+
+# Worker supervision: idle heartbeat interval (a worker silent for 3
+# intervals is restarted), max seconds per answer before the worker is
+# killed, and how often a job whose worker crashed is retried
+WORKER_HEARTBEAT = 5
+WORKER_JOB_TIMEOUT = 300
+WORKER_MAX_RETRIES = 1
 
 # -----------------------------
 # Paths & Storage
@@ -21,10 +61,12 @@ SMTP_PORT = 587
 KB_DIR = "kb"                     # knowledge base files (.md, .txt etc.)
 FAISS_DIR = "faiss_store"         # persistent FAISS index directory
 MEMORY_DIR = "memory"             # per-sender conversation memory files
+CACHE_DIR = "cache"               # answer cache and other runtime caches
 
 os.makedirs(KB_DIR, exist_ok=True)
 os.makedirs(FAISS_DIR, exist_ok=True)
 os.makedirs(MEMORY_DIR, exist_ok=True)
+os.makedirs(CACHE_DIR, exist_ok=True)
 
 # -----------------------------
 # Models
@@ -33,10 +75,124 @@ os.makedirs(MEMORY_DIR, exist_ok=True)
 # Local embedding model (HuggingFace)
 EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
 
+# Batch size for SentenceTransformer.encode and number of embedding
+# threads (0 = embed inline on the calling thread)
+EMBED_BATCH_SIZE = 64
+EMBED_WORKERS = 0
+
 # Local LLM through Ollama
 # You should pull this model with:
 #   ollama pull qwen2.5:3b
 OLLAMA_MODEL = "qwen2.5:3b"
+OLLAMA_BASE_URL = "http://localhost:11434"
+
+# LLM gateway (llm_gateway.py): max concurrent Ollama requests per
+# process, shared by all of its callers, and per-request timeout. The
+# listener, answer workers, batch runs and graph builds each have their
+# own gateway; cap Ollama itself with OLLAMA_NUM_PARALLEL
+LLM_MAX_CONCURRENCY = 2
+LLM_TIMEOUT = 120
+
+# Concurrent triple-extraction requests in policy_graph_builder.py
+POLICY_GRAPH_WORKERS = 4
+
+# -----------------------------
+# Index hot reload
+# -----------------------------
+# Seconds between checks of the ingest manifest by the running listener
+INDEX_RELOAD_INTERVAL = 30
+
+# -----------------------------
+# FAISS index (see index_factory.py)
+# -----------------------------
+# flat_l2 | flat_ip | hnsw | ivf_flat | ivf_pq  -- all but flat_l2 score
+# by cosine (inner product over normalized vectors). Changing the type
+# needs a full `python ingest_kb.py`.
+FAISS_INDEX_TYPE = "flat_ip"
+FAISS_HNSW_M = 32
+FAISS_HNSW_EF_CONSTRUCTION = 80
+FAISS_HNSW_EF_SEARCH = 64             # query time: higher = better recall
+FAISS_IVF_NLIST = 0                   # 0 = auto (~4*sqrt(n))
+FAISS_IVF_NPROBE = 8                  # query time: higher = better recall
+FAISS_PQ_M = 16                       # PQ sub-quantizers (must divide dim)
+
+# Memory-map the index file instead of reading it into RAM, so processes
+# on one host share the OS page cache. FAISS only maps the inverted lists
+# of IVF indexes; flat / HNSW indexes are still read into memory (share
+# those via worker_pool.py's fork-after-load).
+FAISS_MMAP = False
+
+# -----------------------------
+# Retrieval
+# -----------------------------
+# FAISS hits per question; graph expansion then adds up to
+# GRAPH_EXPAND_BUDGET neighbours within GRAPH_EXPAND_HOPS hops whose
+# decayed score (seed cosine x edge weights) is >= GRAPH_MIN_SCORE
+RETRIEVE_TOP_K = 6
+GRAPH_EXPAND_HOPS = 2
+GRAPH_EXPAND_BUDGET = 3
+GRAPH_MIN_SCORE = 0.35
+GRAPH_ADJACENT_WEIGHT = 0.6           # edge weight for prev/next chunks
+
+# Policy-graph facts added to the prompt; when facts are found only the
+# PROMPT_MAX_CHUNKS most question-similar chunks go in as raw text
+POLICY_FACTS_K = 5
+PROMPT_MAX_CHUNKS = 4
+
+# -----------------------------
+# Evidence selection
+# -----------------------------
+# Which hits reach the prompt (see evidence.py): "kmeans" (tiny
+# deterministic k-means, keeps the 2 clusters nearest the question),
+# "mmr" (maximal marginal relevance) or "sklearn" (legacy KMeans)
+EVIDENCE_SELECTOR = "kmeans"
+EVIDENCE_KMEANS_ITERS = 10
+EVIDENCE_MMR_K = 6                    # chunks kept by MMR
+EVIDENCE_MMR_LAMBDA = 0.7             # relevance vs. diversity
+
+# -----------------------------
+# Answer synthesis
+# -----------------------------
+# Replies keep SYNTH_MAX_SENTENCES sentences, so the streamed completion
+# is cut off once that many are complete; SYNTH_MAX_TOKENS is the hard
+# cap (Ollama num_predict)
+SYNTH_MAX_SENTENCES = 2
+SYNTH_MAX_TOKENS = 160
+
+# -----------------------------
+# Entailment reranking
+# -----------------------------
+# "off", "llm" (one JSON-judging prompt per batch of chunks) or
+# "cross_encoder" (local model, one forward pass for all chunks)
+RERANK_BACKEND = "off"
+RERANK_CROSS_ENCODER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+RERANK_BATCH_SIZE = 10                # chunks judged per LLM call
+RERANK_SKIP_SCORE = 0.80              # top dense score that skips reranking
+RERANK_ENOUGH = 3                     # stop after this many confident supports
+RERANK_MIN_CONFIDENCE = 0.6
+RERANK_CACHE_SIZE = 5000              # cached (question, chunk) verdicts
+
+# -----------------------------
+# Answer cache
+# -----------------------------
+# Cached answers are reused when a new question's embedding has cosine
+# similarity >= threshold with a cached one answered against the same KB
+# version, or whose cited files are unchanged since (see answer_cache.py)
+ANSWER_CACHE_PATH = os.path.join(CACHE_DIR, "answer_cache.json")
+ANSWER_CACHE_THRESHOLD = 0.95
+ANSWER_CACHE_SIZE = 500               # max entries (LRU eviction)
+ANSWER_CACHE_TTL = 7 * 24 * 3600      # seconds
+ANSWER_CACHE_SAVE_INTERVAL = 5.0      # seconds between background saves
+
+# -----------------------------
+# Metrics (see metrics.py)
+# -----------------------------
+# Port of the local /metrics (Prometheus) + /metrics.json endpoint and
+# seconds between JSON dumps to METRICS_DUMP_PATH; 0 disables either
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 0
+METRICS_DUMP_INTERVAL = 0
+METRICS_DUMP_PATH = os.path.join(CACHE_DIR, "metrics.json")
 
 # -----------------------------
 # Conversation Memory Settings
@@ -1,11 +1,6 @@
-from llama_index.llms.ollama import Ollama
-from config import OLLAMA_MODEL
+from llm_gateway import GatewayLLM
 
-llm = Ollama(
-    model=OLLAMA_MODEL,
-    temperature=0.1,
-    options={"num_ctx": 2048}
-)
+llm = GatewayLLM(temperature=0.1, num_ctx=2048)
 
 def decompose_query(question: str) -> list[str]:
 
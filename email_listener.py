@@ -1,16 +1,43 @@
 import time
+import queue
+import argparse
 import traceback
 from imapclient import IMAPClient
 import pyzmail
 
-from agent import handle_question
+import metrics
+from agent import handle_question, start_index_watcher, answer_cache, warmup
 from mailer import send_email
+from mail_pipeline import Pipeline, Stage
+from llm_gateway import get_gateway
 from config import (
     GMAIL_ADDRESS,
     GMAIL_APP_PASSWORD,
     IMAP_SERVER,
+    IMAP_IDLE_TIMEOUT,
+    POLL_INTERVAL,
+    FETCH_BATCH_SIZE,
+    RECONNECT_BACKOFF_MAX,
+    PARSE_WORKERS,
+    ANSWER_WORKERS,
+    SEND_WORKERS,
+    PIPELINE_QUEUE_SIZE,
+    ANSWER_PROCESSES,
+    METRICS_HOST,
+    METRICS_PORT,
+    METRICS_DUMP_PATH,
+    METRICS_DUMP_INTERVAL,
 )
 
+# set in __main__ when ANSWER_PROCESSES > 0 (see worker_pool.py)
+_worker_pool = None
+
+# UIDs of emails that were handled (replied, skipped or failed) but are
+# not flagged \Seen yet. Module level so that it survives reconnects:
+# flagging is retried on the next session before UNSEEN is searched,
+# otherwise answered mail would come back unread and be answered twice.
+_finished = queue.Queue()
+
 
 # -----------------------------
 # Helper functions
@@ -54,80 +81,261 @@ def extract_text(message: pyzmail.PyzMessage) -> str:
 # Main mailbox processing
 # -----------------------------
 
-def check_mailbox():
-    print("📥 Connecting to mailbox...")
+class MailJob:
+    """One unread email travelling through the pipeline."""
+
+    __slots__ = ("uid", "raw", "sender", "subject", "body", "reply")
+
+    def __init__(self, uid, raw):
+        self.uid = uid
+        self.raw = raw
+        self.sender = None
+        self.subject = None
+        self.body = None
+        self.reply = None
+
+    def __repr__(self):
+        return f"email uid={self.uid} from {self.sender or '?'}"
+
 
-    with IMAPClient(IMAP_SERVER) as server:
-        server.login(GMAIL_ADDRESS, GMAIL_APP_PASSWORD)
-        server.select_folder("INBOX")
+def parse_stage(job: MailJob) -> bool:
+    msg = pyzmail.PyzMessage.factory(job.raw)
+    job.raw = None
 
-        # fetch unread messages
-        uids = server.search(["UNSEEN"])
+    job.sender = msg.get_addresses("from")[0][1]
+    job.subject = msg.get_subject() or "(no subject)"
+    job.body = extract_text(msg).strip()
 
-        if not uids:
-            print("📭 No new emails.")
-            return
+    print(f"✉️ Processing email from {job.sender} | Subject: {job.subject}")
 
-        for uid in uids:
-            raw = server.fetch(uid, ["RFC822"])[uid][b"RFC822"]
-            msg = pyzmail.PyzMessage.factory(raw)
+    # -----------------------------
+    # Skips
+    # -----------------------------
+    if is_no_reply(job.sender):
+        print(f"⚠️ Skipping system/no-reply email from {job.sender}")
+        metrics.inc("emails", outcome="skipped")
+        return False
 
-            sender = msg.get_addresses("from")[0][1]
-            subject = msg.get_subject() or "(no subject)"
-            body = extract_text(msg).strip()
+    if not job.body or len(job.body) < 5:
+        print(f"⚠️ Skipping empty/short email from {job.sender}")
+        metrics.inc("emails", outcome="skipped")
+        return False
 
-            print(f"✉️ Processing email from {sender} | Subject: {subject}")
+    return True
 
-            # -----------------------------
-            # Skips
-            # -----------------------------
-            if is_no_reply(sender):
-                print(f"⚠️ Skipping system/no-reply email from {sender}")
-                server.add_flags(uid, ["\\Seen"])
-                continue
 
-            if not body or len(body) < 5:
-                print(f"⚠️ Skipping empty/short email from {sender}")
-                server.add_flags(uid, ["\\Seen"])
-                continue
+def answer_stage(job: MailJob) -> bool:
+    # IMPORTANT:
+    # handle_question() already includes the disclaimer
+    if _worker_pool is not None:
+        job.reply = _worker_pool.answer(job.sender, job.body)
+    else:
+        job.reply = handle_question(job.sender, job.body)
+    return True
 
-            # -----------------------------
-            # Handle using agent
-            # -----------------------------
-            try:
-                # IMPORTANT:
-                # handle_question() already includes the disclaimer
-                reply_body = handle_question(sender, body)
 
-                send_email(
-                    to_address=sender,
-                    subject=f"Re: {subject}",
-                    body=reply_body,
-                )
+def send_stage(job: MailJob) -> bool:
+    with metrics.span("send_email"):
+        send_email(
+            to_address=job.sender,
+            subject=f"Re: {job.subject}",
+            body=job.reply,
+        )
+
+    print(f"✅ Replied to {job.sender}")
+    metrics.inc("emails", outcome="replied")
+    return True
+
+
+def flag_finished(server):
+    """Mark every finished email (replied, skipped or failed) as read."""
+    uids = []
+    while True:
+        try:
+            uids.append(_finished.get_nowait())
+        except queue.Empty:
+            break
+
+    if not uids:
+        return
+    try:
+        server.add_flags(uids, ["\\Seen"])
+    except Exception:
+        for uid in uids:            # retried on the next session
+            _finished.put(uid)
+        raise
+
+
+def connect() -> IMAPClient:
+    server = IMAPClient(IMAP_SERVER)
+    server.login(GMAIL_ADDRESS, GMAIL_APP_PASSWORD)
+    server.select_folder("INBOX")
+    return server
+
+
+def fetch_messages(server, uids, batch_size=FETCH_BATCH_SIZE):
+    """
+    Yield (uid, raw) using one FETCH per batch of UIDs.
+    BODY.PEEK[] leaves \\Seen alone; emails are flagged once finished.
+    """
+    for i in range(0, len(uids), batch_size):
+        batch = uids[i:i + batch_size]
+        with metrics.span("imap_fetch"):
+            data = server.fetch(batch, ["BODY.PEEK[]"])
+        metrics.inc("emails_fetched", len(data))
+        for uid in batch:
+            if uid in data:
+                yield uid, data[uid][b"BODY[]"]
+
+
+def check_mailbox(server=None):
+    """
+    Process all unread emails. Uses `server` when given (long-lived IDLE
+    session), otherwise opens a one-off connection. Returns the number
+    of emails fetched.
+    """
+    if server is None:
+        print("📥 Connecting to mailbox...")
+        with connect() as server:
+            return check_mailbox(server)
 
-                print(f"✅ Replied to {sender}")
+    # emails finished while the previous session was dropping
+    flag_finished(server)
 
-            except Exception as e:
-                print(f"❌ Error processing email from {sender}: {repr(e)}")
-                traceback.print_exc()
+    # fetch unread messages
+    uids = server.search(["UNSEEN"])
 
-            finally:
-                # mark as read in any case
-                server.add_flags(uid, ["\\Seen"])
+    if not uids:
+        print("📭 No new emails.")
+        return 0
+
+    # fetch -> parse -> answer -> send, with bounded queues in between;
+    # the IMAP session stays on this thread (it is not thread-safe)
+    pipeline = Pipeline(
+        [
+            Stage("parse", parse_stage, PARSE_WORKERS),
+            Stage("answer", answer_stage, ANSWER_WORKERS),
+            Stage("send", send_stage, SEND_WORKERS),
+        ],
+        on_done=lambda job: _finished.put(job.uid),
+        maxsize=PIPELINE_QUEUE_SIZE,
+    )
+    pipeline.start()
+
+    fetched = 0
+    try:
+        t0 = time.time()
+        for uid, raw in fetch_messages(server, uids):
+            pipeline.record("fetch", time.time() - t0)
+
+            pipeline.put(MailJob(uid, raw))     # blocks when parse is full
+            fetched += 1
+            flag_finished(server)
+            t0 = time.time()
+    finally:
+        # mark as read in any case
+        pipeline.close(on_tick=lambda: flag_finished(server))
+        flag_finished(server)
+        pipeline.report()
+        print(f"🗄️ Answer cache: {answer_cache.stats()}")
+        if _worker_pool is not None:
+            print(f"👷 Answer workers: {_worker_pool.stats()}")
+        else:
+            print(f"🤖 LLM gateway: {get_gateway().stats.summary()}")
+        metrics.report()
+
+    return fetched
 
 
 # -----------------------------
-# Polling loop entry point
+# IDLE loop entry point
 # -----------------------------
 
-if __name__ == "__main__":
-    print("📬 Email agent started. Polling inbox every 60 seconds...")
+def wait_for_mail(server):
+    """
+    Block until the server reports new mail or IMAP_IDLE_TIMEOUT passes
+    (IDLE has to be re-issued periodically; Gmail drops it after ~29min).
+    Falls back to sleeping POLL_INTERVAL for servers without IDLE.
+    """
+    if not server.has_capability("IDLE"):
+        time.sleep(POLL_INTERVAL)
+        return
+
+    server.idle()
+    try:
+        responses = server.idle_check(timeout=IMAP_IDLE_TIMEOUT)
+    finally:
+        server.idle_done()
+
+    if responses:
+        print(f"🔔 IMAP push: {responses}")
+
+
+def run_forever():
+    backoff = 1
 
     while True:
+        server = None
         try:
-            check_mailbox()
+            print("📥 Connecting to mailbox...")
+            server = connect()
+            backoff = 1
+
+            while True:
+                # mail that arrived during a pass is announced while we
+                # FETCH / STORE, not to the next IDLE: re-check until empty
+                while check_mailbox(server):
+                    pass
+                wait_for_mail(server)
+
         except Exception as e:
-            print("💥 Fatal error in polling loop:", repr(e))
+            print("💥 Fatal error in mailbox loop:", repr(e))
             traceback.print_exc()
 
-        time.sleep(60)
+            print(f"🔁 Reconnecting in {backoff}s...")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, RECONNECT_BACKOFF_MAX)
+
+        finally:
+            if server is not None:
+                try:
+                    server.logout()
+                except Exception:
+                    pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer policy questions by email.")
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="check the mailbox once and exit (cron); models and index "
+             "are only loaded if there is mail to answer",
+    )
+    args = parser.parse_args()
+
+    if args.once:
+        check_mailbox()
+    else:
+        if ANSWER_PROCESSES > 0:
+            # load once, then fork the answer workers (copy-on-write sharing)
+            from worker_pool import WorkerPool
+            _worker_pool = WorkerPool(ANSWER_PROCESSES).start()
+            metrics.add_gauges("worker_pool", _worker_pool.stats)
+        else:
+            # long-running: pay the model / index load up front
+            warmup()
+            metrics.add_gauges("llm_gateway", lambda: get_gateway().stats.summary())
+
+        metrics.add_gauges("answer_cache", answer_cache.stats)
+        if METRICS_PORT:
+            metrics.serve(METRICS_PORT, METRICS_HOST)
+        if METRICS_DUMP_INTERVAL:
+            metrics.start_dump(METRICS_DUMP_PATH, METRICS_DUMP_INTERVAL)
+
+        print("📬 Email agent started. Waiting for new mail (IMAP IDLE)...")
+
+        # pick up `ingest_kb.py` runs without restarting the listener
+        start_index_watcher()
+
+        run_forever()
@@ -0,0 +1,168 @@
+"""
+Shared embedding service.
+
+One SentenceTransformer instance per process, used by retrieval (through
+LlamaIndex), clustering, citation scoring and ingestion.
+
+Normalization contract: every vector returned from this module is float32
+and L2-normalized, so a dot product is a cosine similarity.
+
+Importing this module is cheap: sentence-transformers is imported when
+the model is first needed, LlamaIndex when SharedEmbedding is first used.
+"""
+
+import os
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from config import (
+    EMBEDDING_MODEL_NAME,
+    EMBED_BATCH_SIZE,
+    EMBED_WORKERS,
+)
+
+
+_model = None
+_executor = None
+_shared_embedding = None
+_lock = threading.Lock()
+
+
+# -----------------------------
+# MODEL
+# -----------------------------
+
+def get_model():
+    """Load the embedding model (a SentenceTransformer) once and share it."""
+    global _model
+    if _model is None:
+        with _lock:
+            if _model is None:
+                from sentence_transformers import SentenceTransformer
+                _model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+    return _model
+
+
+def _reset_after_fork():
+    # the model (already loaded) is shared copy-on-write with forked
+    # workers; the thread pool and lock are not usable there
+    global _executor, _lock
+    _executor = None
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def embedding_dim() -> int:
+    return get_model().get_sentence_embedding_dimension()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=EMBED_WORKERS,
+                    thread_name_prefix="embed",
+                )
+    return _executor
+
+
+# -----------------------------
+# EMBEDDING
+# -----------------------------
+
+def embed(texts, batch_size=EMBED_BATCH_SIZE) -> np.ndarray:
+    """Embed a list of texts -> (n, dim) float32, L2-normalized."""
+    texts = list(texts)
+    if not texts:
+        return np.zeros((0, embedding_dim()), dtype=np.float32)
+
+    vecs = get_model().encode(
+        texts,
+        batch_size=batch_size,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+        show_progress_bar=False,
+    )
+    return np.asarray(vecs, dtype=np.float32)
+
+
+def embed_async(texts, batch_size=EMBED_BATCH_SIZE):
+    """
+    Submit texts to the embedding thread pool; returns a Future.
+    Falls back to a completed Future when EMBED_WORKERS is 0.
+    """
+    if EMBED_WORKERS <= 0:
+        from concurrent.futures import Future
+        fut = Future()
+        try:
+            fut.set_result(embed(texts, batch_size))
+        except Exception as e:
+            fut.set_exception(e)
+        return fut
+
+    return _get_executor().submit(embed, list(texts), batch_size)
+
+
+def embed_many(texts, batch_size=EMBED_BATCH_SIZE) -> np.ndarray:
+    """
+    Embed a large list of texts, spreading batches over the thread pool
+    (the model releases the GIL inside forward passes).
+    """
+    texts = list(texts)
+    if EMBED_WORKERS <= 1 or len(texts) <= batch_size:
+        return embed(texts, batch_size)
+
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    futures = [embed_async(b, batch_size) for b in batches]
+    return np.vstack([f.result() for f in futures])
+
+
+# -----------------------------
+# LLAMAINDEX ADAPTER
+# -----------------------------
+
+def _define_shared_embedding():
+    from llama_index.core.embeddings import BaseEmbedding
+
+    class SharedEmbedding(BaseEmbedding):
+        """LlamaIndex embed_model backed by the shared model above."""
+
+        model_name: str = EMBEDDING_MODEL_NAME
+        embed_batch_size: int = EMBED_BATCH_SIZE
+
+        @classmethod
+        def class_name(cls) -> str:
+            return "SharedEmbedding"
+
+        def _get_query_embedding(self, query: str):
+            return embed([query])[0].tolist()
+
+        async def _aget_query_embedding(self, query: str):
+            return self._get_query_embedding(query)
+
+        def _get_text_embedding(self, text: str):
+            return embed([text])[0].tolist()
+
+        def _get_text_embeddings(self, texts):
+            return embed_many(texts).tolist()
+
+    return SharedEmbedding
+
+
+def __getattr__(name):
+    # `from embeddings import SharedEmbedding` defines the class (and
+    # imports LlamaIndex) on first use only
+    global _shared_embedding
+    if name == "SharedEmbedding":
+        if _shared_embedding is None:
+            _shared_embedding = _define_shared_embedding()
+        return _shared_embedding
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
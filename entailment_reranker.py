@@ -1,39 +1,273 @@
-from llama_index.llms.ollama import Ollama
-from config import OLLAMA_MODEL
+"""
+Entailment reranking of retrieved chunks.
+
+Two backends, both judging every candidate of a question at once:
+
+- "llm"           one structured prompt per batch of chunks, JSON reply
+- "cross_encoder" local CrossEncoder, one vectorized forward pass
+
+Verdicts are cached per (question hash, chunk id), so the same chunk is
+never judged twice for the same question.
+"""
 
-llm = Ollama(
-    model=OLLAMA_MODEL,
-    temperature=0.0,
-    options={"num_ctx": 2048}
+import re
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+from config import (
+    RERANK_BACKEND,
+    RERANK_CROSS_ENCODER_MODEL,
+    RERANK_BATCH_SIZE,
+    RERANK_SKIP_SCORE,
+    RERANK_ENOUGH,
+    RERANK_MIN_CONFIDENCE,
+    RERANK_CACHE_SIZE,
 )
+from llm_gateway import GatewayLLM, PRIORITY_LIVE
 
-def score_entailment(question: str, text: str):
+llm = GatewayLLM(temperature=0.0, num_ctx=4096)
+
+LABELS = ("supports", "contradicts", "irrelevant")
+IRRELEVANT = {"label": "irrelevant", "confidence": 0.0}
+
+_cross_encoder = None
+_model_lock = threading.Lock()
+
+
+# -----------------------------
+# Verdict cache
+# -----------------------------
+
+class VerdictCache:
+    """Bounded LRU of (backend, question hash, chunk id) -> verdict."""
+
+    def __init__(self, max_entries=RERANK_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def question_key(question):
+        norm = re.sub(r"\s+", " ", question).strip().lower()
+        return hashlib.sha1(norm.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            verdict = self._entries.get(key)
+            if verdict is not None:
+                self._entries.move_to_end(key)
+            return verdict
+
+    def put(self, key, verdict):
+        with self._lock:
+            self._entries[key] = verdict
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+verdict_cache = VerdictCache()
+
+
+# -----------------------------
+# Reply parsing
+# -----------------------------
+
+def _verdict(item):
+    """Validate one {"label", "confidence"} object."""
+    if not isinstance(item, dict):
+        return dict(IRRELEVANT)
+
+    label = str(item.get("label", "")).strip().lower()
+    if label not in LABELS:
+        return dict(IRRELEVANT)
+
+    try:
+        confidence = min(1.0, max(0.0, float(item.get("confidence", 0.0))))
+    except (TypeError, ValueError):
+        confidence = 0.0
+
+    return {"label": label, "confidence": confidence}
+
+
+def parse_verdicts(text, n):
     """
-    Return label + confidence:
-    - supports
-    - contradicts
-    - irrelevant
+    Parse a JSON array of {"id", "label", "confidence"} from an LLM reply
+    (tolerates prose / code fences around it). Missing or malformed
+    entries come back as irrelevant.
     """
+    verdicts = [dict(IRRELEVANT) for _ in range(n)]
+
+    match = re.search(r"\[.*\]", text, re.S)
+    try:
+        items = json.loads(match.group(0)) if match else []
+    except json.JSONDecodeError:
+        items = []
+
+    if not isinstance(items, list):
+        return verdicts
+
+    for pos, item in enumerate(items):
+        idx = item.get("id") if isinstance(item, dict) else None
+        try:
+            idx = int(idx) - 1
+        except (TypeError, ValueError):
+            idx = pos
+        if 0 <= idx < n:
+            verdicts[idx] = _verdict(item)
+
+    return verdicts
+
+
+# -----------------------------
+# Backends
+# -----------------------------
+
+def _judge_llm(question, texts, priority=PRIORITY_LIVE):
+    passages = "\n\n".join(f"[{i}]\n{t}" for i, t in enumerate(texts, 1))
 
     prompt = f"""
-Determine whether the document text supports the user question.
+For each numbered document passage, determine whether it supports the
+user question, contradicts it, or is irrelevant to it.
 
-Respond JSON:
-{{
- "label": "supports" | "contradicts" | "irrelevant",
- "confidence": 0.0–1.0
-}}
+Respond with a JSON array only, one object per passage:
+[
+ {{"id": 1, "label": "supports" | "contradicts" | "irrelevant", "confidence": 0.0–1.0}}
+]
 
 Question:
 {question}
 
-Text:
-{text}
+Passages:
+{passages}
 """
 
-    resp = llm.complete(prompt).text.strip()
+    resp = llm.complete(prompt, priority).text
+    return parse_verdicts(resp, len(texts))
 
-    try:
-        return eval(resp)
-    except Exception:
-        return {"label": "irrelevant", "confidence": 0.0}
+
+def get_cross_encoder():
+    global _cross_encoder
+    if _cross_encoder is None:
+        with _model_lock:
+            if _cross_encoder is None:
+                from sentence_transformers import CrossEncoder
+                _cross_encoder = CrossEncoder(RERANK_CROSS_ENCODER_MODEL)
+    return _cross_encoder
+
+
+def _judge_cross_encoder(question, texts, priority=PRIORITY_LIVE):
+    # relevance models have no "contradicts" class: score >= threshold
+    # counts as support, everything else as irrelevant
+    import torch
+
+    # ms-marco cross-encoders default to raw logits (Identity activation);
+    # a sigmoid puts scores in [0, 1] like the LLM path's confidences
+    scores = get_cross_encoder().predict(
+        [(question, t) for t in texts],
+        batch_size=len(texts),
+        show_progress_bar=False,
+        activation_fct=torch.nn.Sigmoid(),
+    )
+    return [
+        {
+            "label": "supports" if s >= RERANK_MIN_CONFIDENCE else "irrelevant",
+            "confidence": float(s),
+        }
+        for s in scores
+    ]
+
+
+BACKENDS = {
+    "llm": _judge_llm,
+    "cross_encoder": _judge_cross_encoder,
+}
+
+
+# -----------------------------
+# Public API
+# -----------------------------
+
+def judge(question, items, backend=RERANK_BACKEND, priority=PRIORITY_LIVE,
+          enough=RERANK_ENOUGH):
+    """
+    Verdicts for `items` = [(chunk_id, text)], in the given order.
+
+    Cached pairs are not re-judged. Uncached ones go to the backend in
+    batches of RERANK_BATCH_SIZE; once `enough` chunks are confident
+    supports, the remaining items are left unjudged (None).
+    """
+    judge_fn = BACKENDS[backend]
+    qkey = VerdictCache.question_key(question)
+    keys = [(backend, qkey, cid) for cid, _ in items]
+
+    verdicts = [verdict_cache.get(k) for k in keys]
+
+    def confident():
+        return sum(
+            1 for v in verdicts
+            if v and v["label"] == "supports"
+            and v["confidence"] >= RERANK_MIN_CONFIDENCE
+        )
+
+    todo = [i for i, v in enumerate(verdicts) if v is None]
+    for start in range(0, len(todo), RERANK_BATCH_SIZE):
+        if confident() >= enough:
+            break
+
+        batch = todo[start:start + RERANK_BATCH_SIZE]
+        judged = judge_fn(question, [items[i][1] for i in batch], priority)
+        for i, v in zip(batch, judged):
+            verdicts[i] = v
+            verdict_cache.put(keys[i], v)
+
+    return verdicts
+
+
+def rerank(question, hits, backend=RERANK_BACKEND, priority=PRIORITY_LIVE):
+    """
+    Indices of `hits` worth keeping, best first: supporting chunks, then
+    contradicting ones (both are evidence), by verdict confidence.
+
+    Early exits: reranking is skipped when the top dense score is already
+    >= RERANK_SKIP_SCORE, and stops once RERANK_ENOUGH chunks are
+    confident supports. Falls back to the original order if nothing is
+    judged relevant.
+    """
+    order = list(range(len(hits)))
+    if backend == "off" or not hits:
+        return order
+    if max(h.score for h in hits) >= RERANK_SKIP_SCORE:
+        return order
+
+    # judge in dense-score order so an early exit keeps the best hits
+    order.sort(key=lambda i: hits[i].score, reverse=True)
+    verdicts = judge(
+        question,
+        [(hits[i].node.node_id, hits[i].node.text) for i in order],
+        backend,
+        priority,
+    )
+
+    rank = {"supports": 0, "contradicts": 1}
+    kept = [
+        (rank[v["label"]], -v["confidence"], pos, i)
+        for pos, (i, v) in enumerate(zip(order, verdicts))
+        if v and v["label"] in rank
+    ]
+    if not kept:
+        return order
+
+    return [i for *_, i in sorted(kept)]
+
+
+def score_entailment(question: str, text: str):
+    """
+    Return label + confidence for a single chunk:
+    - supports
+    - contradicts
+    - irrelevant
+    """
+    return _judge_llm(question, [text])[0]
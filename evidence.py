@@ -0,0 +1,142 @@
+"""
+Evidence selection: which retrieved chunks go into the synthesis prompt.
+
+Every selector takes the (n, dim) normalized chunk matrix and the
+question vector and returns the sorted positions of the chunks to keep.
+
+    kmeans   tiny deterministic k-means (farthest-point init, fixed
+             iterations), keeps the two clusters closest to the question
+    mmr      maximal marginal relevance: relevant but mutually diverse
+    sklearn  the original per-query sklearn KMeans (for comparison)
+
+With fewer than 4 hits every selector keeps all of them.
+"""
+
+import numpy as np
+
+from config import (
+    EVIDENCE_SELECTOR,
+    EVIDENCE_KMEANS_ITERS,
+    EVIDENCE_MMR_K,
+    EVIDENCE_MMR_LAMBDA,
+)
+
+
+def _n_clusters(n):
+    if n >= 8:
+        return 3
+    if n >= 4:
+        return 2
+    return 0
+
+
+def _closest_clusters(labels, centroids, q_vec, keep=2):
+    """Positions of the members of the `keep` clusters nearest to q."""
+    present = np.unique(labels)
+    sims = centroids[present] @ q_vec
+    chosen = present[np.argsort(-sims, kind="stable")[:keep]]
+    return np.flatnonzero(np.isin(labels, chosen))
+
+
+# -----------------------------
+# Selectors
+# -----------------------------
+
+def select_kmeans(chunk_vecs, q_vec, iters=EVIDENCE_KMEANS_ITERS):
+    """
+    Lloyd's k-means on the hit matrix with farthest-point seeding from
+    the first (top-ranked) hit: deterministic, no restarts, at most
+    `iters` iterations (stops early once assignments are stable).
+    """
+    X = chunk_vecs
+    k = _n_clusters(len(X))
+    if k == 0:
+        return np.arange(len(X))
+
+    # farthest-point init (squared euclidean)
+    sq = (X * X).sum(axis=1)
+    seeds = [0]
+    dist = sq + sq[0] - 2 * (X @ X[0])
+    for _ in range(1, k):
+        i = int(np.argmax(dist))
+        seeds.append(i)
+        dist = np.minimum(dist, sq + sq[i] - 2 * (X @ X[i]))
+
+    centroids = X[seeds].copy()
+    labels = None
+    for _ in range(max(1, iters)):
+        # argmin ||x - c||^2 == argmin (||c||^2 - 2 x.c)
+        new_labels = np.argmin(
+            (centroids * centroids).sum(axis=1) - 2 * (X @ centroids.T),
+            axis=1,
+        )
+        if labels is not None and np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        onehot = np.eye(k, dtype=X.dtype)[labels]
+        counts = onehot.sum(axis=0)
+        nonempty = counts > 0
+        centroids[nonempty] = (onehot.T @ X)[nonempty] / counts[nonempty, None]
+
+    # centroids are now the member means of the last assignment
+    return _closest_clusters(labels, centroids, q_vec)
+
+
+def select_mmr(chunk_vecs, q_vec, k=EVIDENCE_MMR_K, lam=EVIDENCE_MMR_LAMBDA):
+    """
+    Greedy MMR: repeatedly take the chunk maximizing
+    lam * sim(q, c) - (1 - lam) * max sim(c, already chosen).
+    """
+    n = len(chunk_vecs)
+    if _n_clusters(n) == 0 or n <= k:
+        return np.arange(n)
+
+    relevance = chunk_vecs @ q_vec
+    pairwise = chunk_vecs @ chunk_vecs.T
+
+    first = int(np.argmax(relevance))
+    chosen = [first]
+    redundancy = pairwise[first].copy()
+    available = np.ones(n, dtype=bool)
+    available[first] = False
+
+    for _ in range(k - 1):
+        score = lam * relevance - (1 - lam) * redundancy
+        score[~available] = -np.inf
+        i = int(np.argmax(score))
+        chosen.append(i)
+        available[i] = False
+        redundancy = np.maximum(redundancy, pairwise[i])
+
+    return np.sort(chosen)
+
+
+def select_sklearn(chunk_vecs, q_vec):
+    """The original path: sklearn KMeans fitted per question."""
+    k = _n_clusters(len(chunk_vecs))
+    if k == 0:
+        return np.arange(len(chunk_vecs))
+
+    from sklearn.cluster import KMeans
+
+    kmeans = KMeans(n_clusters=k, n_init="auto", random_state=42)
+    labels = kmeans.fit_predict(chunk_vecs)
+
+    # the original scored the mean of each cluster's normalized members
+    centroids = np.vstack([
+        chunk_vecs[labels == cid].mean(axis=0) for cid in range(k)
+    ])
+    return _closest_clusters(labels, centroids, q_vec)
+
+
+SELECTORS = {
+    "kmeans": select_kmeans,
+    "mmr": select_mmr,
+    "sklearn": select_sklearn,
+}
+
+
+def select(chunk_vecs, q_vec, method=EVIDENCE_SELECTOR):
+    if method not in SELECTORS:
+        raise ValueError(f"Unknown evidence selector: {method}")
+    return SELECTORS[method](chunk_vecs, q_vec)
@@ -1,5 +1,12 @@
+import os
+import json
 from typing import List
 
+import numpy as np
+
+
+SEMANTIC_EDGE_THRESHOLD = 0.60
+
 def get_adjacent(node, all_nodes_dict):
     results = []
 
@@ -13,4 +20,170 @@ def get_adjacent(node, all_nodes_dict):
         if nid in all_nodes_dict:
             results.append(all_nodes_dict[nid])
 
-    return results
\ No newline at end of file
+    return results
+
+
+def build_semantic_edges(node_ids, files, vecs,
+                         threshold=SEMANTIC_EDGE_THRESHOLD, block=1024,
+                         min_col=0):
+    """
+    Connect semantically related chunks, even across files.
+
+    `vecs` is an (n, dim) matrix of L2-normalized vectors aligned with
+    `node_ids` / `files`. Similarities are computed with blocked matrix
+    products, so peak memory is block x block floats instead of n x n.
+    Edges come out in the same (i < j) order as combinations(nodes, 2).
+
+    With `min_col` only pairs whose second node has index >= min_col are
+    scored, i.e. edges touching the rows appended after min_col. This is
+    how incremental ingest patches the graph for new chunks only.
+    """
+    vecs = np.asarray(vecs, dtype=np.float32)
+    n = len(node_ids)
+    edges = []
+
+    for i0 in range(0, n, block):
+        i1 = min(i0 + block, n)
+        rows, cols, sims = [], [], []
+
+        for j0 in range(max(i0, min_col), n, block):
+            j1 = min(j0 + block, n)
+            s = vecs[i0:i1] @ vecs[j0:j1].T
+
+            r, c = np.nonzero(s >= threshold)
+            r_abs, c_abs = r + i0, c + j0
+            upper = c_abs > r_abs            # only strict upper triangle
+            rows.append(r_abs[upper])
+            cols.append(c_abs[upper])
+            sims.append(s[r[upper], c[upper]])
+
+        if not rows:
+            continue
+
+        rows = np.concatenate(rows)
+        cols = np.concatenate(cols)
+        sims = np.concatenate(sims)
+        order = np.lexsort((cols, rows))
+
+        for i, j, sim in zip(rows[order], cols[order], sims[order]):
+            edges.append({
+                "a": node_ids[i],
+                "b": node_ids[j],
+                "similarity": round(float(sim), 3),
+                "a_file": files[i],
+                "b_file": files[j],
+            })
+
+    return edges
+
+
+class SemanticGraph:
+    """
+    In-memory CSR adjacency over chunk ids.
+
+    Built once per index load from semantic_graph.json (similarity-weighted
+    cross-document edges) plus the prev/next links between consecutive
+    chunks of the same file. Edges are stored in both directions:
+    neighbours of row i are indices[indptr[i]:indptr[i + 1]] with the
+    matching weights.
+    """
+
+    def __init__(self, node_ids, edges):
+        self.node_ids = list(node_ids)
+        self.index = {nid: i for i, nid in enumerate(self.node_ids)}
+
+        src, dst, w = [], [], []
+        for a, b, weight in edges:
+            ia, ib = self.index.get(a), self.index.get(b)
+            if ia is None or ib is None:
+                continue
+            src += [ia, ib]
+            dst += [ib, ia]
+            w += [weight, weight]
+
+        src = np.asarray(src, dtype=np.int64)
+        order = np.argsort(src, kind="stable")
+
+        self.indices = np.asarray(dst, dtype=np.int64)[order]
+        self.weights = np.asarray(w, dtype=np.float32)[order]
+        self.indptr = np.zeros(len(self.node_ids) + 1, dtype=np.int64)
+        np.cumsum(
+            np.bincount(src, minlength=len(self.node_ids)),
+            out=self.indptr[1:],
+        )
+
+    @classmethod
+    def load(cls, graph_path, adjacent=None, adjacent_weight=0.6):
+        """
+        Read semantic_graph.json and add the prev/next chunk links
+        (`adjacent`: iterable of (node id, next node id)) with a fixed
+        `adjacent_weight`.
+        """
+        edges = []
+        node_ids = set()
+
+        if os.path.exists(graph_path):
+            with open(graph_path) as f:
+                for e in json.load(f):
+                    edges.append((e["a"], e["b"], e["similarity"]))
+                    node_ids.update((e["a"], e["b"]))
+
+        for a, b in adjacent or ():
+            edges.append((a, b, adjacent_weight))
+            node_ids.update((a, b))
+
+        return cls(sorted(node_ids), edges)
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def neighbors(self, node_id):
+        """[(neighbour id, weight)] for one chunk."""
+        i = self.index.get(node_id)
+        if i is None:
+            return []
+        lo, hi = self.indptr[i], self.indptr[i + 1]
+        return [
+            (self.node_ids[j], float(w))
+            for j, w in zip(self.indices[lo:hi], self.weights[lo:hi])
+        ]
+
+    def expand(self, seeds, hops=2, budget=4, min_score=0.3):
+        """
+        Similarity-weighted neighbourhood expansion.
+
+        `seeds` maps node id -> relevance to the question. A neighbour
+        reached over an edge of weight w from a node scored s gets score
+        s * w (best path wins); scores decay every hop. Returns up to
+        `budget` new (node_id, score) pairs scoring >= min_score, best first.
+        """
+        seen = {self.index[nid] for nid in seeds if nid in self.index}
+        frontier = {
+            self.index[nid]: score
+            for nid, score in seeds.items() if nid in self.index
+        }
+        found = {}
+
+        for _ in range(hops):
+            nxt = {}
+            for i, score in frontier.items():
+                lo, hi = self.indptr[i], self.indptr[i + 1]
+                cand = score * self.weights[lo:hi]
+                for j, s in zip(self.indices[lo:hi], cand):
+                    j = int(j)
+                    if j in seen or s < min_score:
+                        continue
+                    if s > nxt.get(j, 0.0):
+                        nxt[j] = float(s)
+
+            for j, s in nxt.items():
+                if s > found.get(j, 0.0):
+                    found[j] = s
+
+            seen.update(nxt)
+            frontier = nxt
+            if not frontier:
+                break
+
+        best = sorted(found.items(), key=lambda kv: kv[1], reverse=True)
+        return [(self.node_ids[j], s) for j, s in best[:budget]]
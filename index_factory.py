@@ -0,0 +1,142 @@
+"""
+FAISS index construction and query-time tuning.
+
+All index types except "flat_l2" use inner product, which is cosine
+similarity for the L2-normalized vectors produced by embeddings.py.
+
+    flat_l2   exact, L2 distance (legacy)
+    flat_ip   exact, cosine
+    hnsw      graph-based ANN (efSearch tunes recall/latency)
+    ivf_flat  inverted lists over full vectors (nprobe tunes recall/latency)
+    ivf_pq    inverted lists over product-quantized codes (lowest RAM)
+"""
+
+import os
+import math
+
+import faiss
+import numpy as np
+
+from config import (
+    FAISS_INDEX_TYPE,
+    FAISS_HNSW_M,
+    FAISS_HNSW_EF_CONSTRUCTION,
+    FAISS_HNSW_EF_SEARCH,
+    FAISS_IVF_NLIST,
+    FAISS_IVF_NPROBE,
+    FAISS_PQ_M,
+    FAISS_MMAP,
+)
+
+
+INDEX_TYPES = ("flat_l2", "flat_ip", "hnsw", "ivf_flat", "ivf_pq")
+
+
+def auto_nlist(n: int) -> int:
+    """~4*sqrt(n) lists, with >= 39 training points per list."""
+    return max(1, min(int(4 * math.sqrt(n)), n // 39))
+
+
+def make_index(vecs, kind=FAISS_INDEX_TYPE, nlist=FAISS_IVF_NLIST):
+    """
+    Create (and train, if needed) an empty FAISS index for `vecs`.
+    The caller adds the vectors. Falls back to flat_ip when there are
+    too few vectors to train the requested index type.
+    """
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown FAISS index type: {kind}")
+
+    vecs = np.ascontiguousarray(vecs, dtype=np.float32)
+    n, dim = vecs.shape
+    ip = faiss.METRIC_INNER_PRODUCT
+
+    if kind == "flat_l2":
+        return faiss.IndexFlatL2(dim)
+
+    if kind == "flat_ip":
+        return faiss.IndexFlatIP(dim)
+
+    if kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, FAISS_HNSW_M, ip)
+        index.hnsw.efConstruction = FAISS_HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = FAISS_HNSW_EF_SEARCH
+        return index
+
+    nlist = nlist or auto_nlist(n)
+
+    # k-means wants >= 39 points per centroid: nlist lists, and 256
+    # centroids per PQ sub-quantizer (8-bit codes)
+    if n < 39 * nlist or (kind == "ivf_pq" and n < 39 * 256):
+        print(f"⚠️ {n} vectors are too few to train {kind}; using flat_ip.")
+        return faiss.IndexFlatIP(dim)
+
+    quantizer = faiss.IndexFlatIP(dim)
+    if kind == "ivf_flat":
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist, ip)
+    else:
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, FAISS_PQ_M, 8, ip)
+
+    index.train(vecs)
+    index.nprobe = FAISS_IVF_NPROBE
+    return index
+
+
+def read_index(path, mmap=FAISS_MMAP):
+    """faiss.read_index, optionally memory-mapped (read-only)."""
+    if not mmap:
+        return faiss.read_index(path)
+
+    index = faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    if _as_ivf(index) is None:
+        print(f"ℹ️ FAISS mmap only applies to IVF indexes; "
+              f"{type(index).__name__} was read into memory.")
+    return index
+
+
+def write_index(index, path):
+    """
+    faiss.write_index via a temp file + rename. Rewriting the file in
+    place would truncate pages that running listeners / answer workers
+    have mmap'd (FAISS_MMAP) and crash them with SIGBUS; after the
+    rename they keep the old inode until they reload.
+    """
+    tmp = f"{path}.{os.getpid()}.tmp"
+    faiss.write_index(index, tmp)
+    os.replace(tmp, path)
+
+
+def configure_search(index, nprobe=FAISS_IVF_NPROBE, ef_search=FAISS_HNSW_EF_SEARCH):
+    """
+    Query-time knobs (these are not all persisted by write_index) and a
+    direct map so reconstruct() works on IVF indexes.
+    """
+    ivf = _as_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = nprobe
+        ivf.make_direct_map()
+
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search
+
+    return index
+
+
+def is_lossy(index) -> bool:
+    """True when reconstruct() only returns an approximation (PQ codes)."""
+    return isinstance(_as_ivf(index), faiss.IndexIVFPQ)
+
+
+def _as_ivf(index):
+    try:
+        return faiss.downcast_index(faiss.extract_index_ivf(index))
+    except RuntimeError:
+        return None
+
+
+def describe(index) -> str:
+    ivf = _as_ivf(index)
+    if ivf is not None:
+        return f"{type(ivf).__name__}(nlist={ivf.nlist}, nprobe={ivf.nprobe})"
+    if isinstance(index, faiss.IndexHNSW):
+        return f"{type(index).__name__}(efSearch={index.hnsw.efSearch})"
+    return type(index).__name__
@@ -1,24 +1,34 @@
 import os
-import faiss
 import numpy as np
-from itertools import combinations
 import json
+import argparse
 
 from llama_index.core import (
     SimpleDirectoryReader,
     VectorStoreIndex,
     StorageContext,
     Settings,
+    load_index_from_storage,
 )
 
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
 from llama_index.vector_stores.faiss import FaissVectorStore
 from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import MetadataMode
 
 from llama_index.core.storage.docstore import SimpleDocumentStore
 from llama_index.core.storage.index_store import SimpleIndexStore
 
-from config import KB_DIR, FAISS_DIR, EMBEDDING_MODEL_NAME
+from config import KB_DIR, FAISS_DIR
+from embeddings import SharedEmbedding, embedding_dim, embed_many
+from graph_utils import build_semantic_edges
+from kb_utils import scan_kb, load_manifest, save_manifest
+from index_factory import make_index, write_index, configure_search, describe, is_lossy
+from retrieval import Chunk
+from chunk_store import ChunkStore
+
+
+GRAPH_PATH = os.path.join(FAISS_DIR, "semantic_graph.json")
+POLICY_GRAPH_PATH = os.path.join(FAISS_DIR, "policy_graph.json")
 
 
 # =========================
@@ -28,101 +38,306 @@ os.makedirs(KB_DIR, exist_ok=True)
 os.makedirs(FAISS_DIR, exist_ok=True)
 
 
-print("📚 Loading knowledge base files...")
-documents = SimpleDirectoryReader(KB_DIR).load_data()
+# =========================
+# Loading & chunking
+# =========================
 
-print("✂️ Chunking documents...")
-splitter = SentenceSplitter(chunk_size=300, chunk_overlap=30)
-nodes = splitter.get_nodes_from_documents(documents)
+def load_nodes(file_names):
+    """Read + chunk the given KB files (names relative to KB_DIR)."""
+    if not file_names:
+        return []
 
-# add file name for citation support
-for n in nodes:
-    n.metadata["file_name"] = n.metadata.get(
-        "file_name",
-        n.metadata.get("file_path", "KB Document")
-    )
+    paths = [os.path.join(KB_DIR, f) for f in file_names]
+    documents = SimpleDirectoryReader(input_files=paths).load_data()
 
+    splitter = SentenceSplitter(chunk_size=300, chunk_overlap=30)
+    nodes = splitter.get_nodes_from_documents(documents)
 
-# =========================
-# Embedding model
-# =========================
-print("🧠 Loading embedding model...")
-Settings.embed_model = HuggingFaceEmbedding(
-    model_name=EMBEDDING_MODEL_NAME
-)
+    # add file name for citation support
+    for n in nodes:
+        n.metadata["file_name"] = n.metadata.get(
+            "file_name",
+            n.metadata.get("file_path", "KB Document")
+        )
 
-sample_vec = Settings.embed_model.get_text_embedding("hello world")
-dim = len(sample_vec)
-print(f"📏 Embedding dimension: {dim}")
+    return nodes
 
 
 # =========================
 # FAISS index
 # =========================
-print("📦 Creating FAISS vector index...")
 
-faiss_index = faiss.IndexFlatL2(dim)
-vector_store = FaissVectorStore(faiss_index=faiss_index)
+def node_vectors(nodes):
+    """
+    (n, dim) matrix for `nodes`, embedding only the ones without an
+    `.embedding` (one batched pass, same text LlamaIndex would embed).
+    """
+    missing = [n for n in nodes if n.embedding is None]
+    if missing:
+        vecs = embed_many([
+            n.get_content(metadata_mode=MetadataMode.EMBED) for n in missing
+        ])
+        for n, v in zip(missing, vecs):
+            n.embedding = v.tolist()
+
+    return np.asarray([n.embedding for n in nodes], dtype=np.float32) \
+        .reshape(len(nodes), embedding_dim())
+
+
+def build_vector_index(nodes):
+    """
+    Build + persist a fresh FAISS-backed index over `nodes`.
+    Nodes that already carry an `.embedding` are not re-embedded.
+    Returns the index, the FAISS index and the vectors in row order.
+    """
+    vecs = node_vectors(nodes)
+
+    # FAISS_INDEX_TYPE decides flat / HNSW / IVF; IVF types are trained
+    # on the ingested vectors before anything is added
+    faiss_index = make_index(vecs)
+    vector_store = FaissVectorStore(faiss_index=faiss_index)
+
+    docstore = SimpleDocumentStore()
+    index_store = SimpleIndexStore()
+
+    storage_context = StorageContext.from_defaults(
+        vector_store=vector_store,
+        docstore=docstore,
+        index_store=index_store,
+    )
+
+    # index the chunks as-is (no second split) so node ids in the docstore,
+    # FAISS rows and the semantic graph all line up
+    index = VectorStoreIndex(
+        nodes,
+        storage_context=storage_context,
+    )
 
-docstore = SimpleDocumentStore()
-index_store = SimpleIndexStore()
+    # persist FAISS
+    write_index(faiss_index, os.path.join(FAISS_DIR, "vector_store.faiss"))
+    docstore.persist(os.path.join(FAISS_DIR, "docstore.json"))
+    index_store.persist(os.path.join(FAISS_DIR, "index_store.json"))
 
-storage_context = StorageContext.from_defaults(
-    persist_dir=FAISS_DIR,
-    vector_store=vector_store,
-    docstore=docstore,
-    index_store=index_store,
-)
+    # compact mmap'd chunk table for the agent (the JSON docstore above
+    # is only read back by incremental ingest)
+    write_chunk_store(index, nodes)
 
-print("🧩 Building index...")
-index = VectorStoreIndex.from_documents(
-    nodes,
-    storage_context=storage_context,
-)
+    print(f"📦 FAISS index: {describe(faiss_index)}")
+    return index, faiss_index, vecs
+
+
+def write_chunk_store(index, nodes):
+    node_by_id = {n.node_id: n for n in nodes}
+    rows = sorted((int(k), v) for k, v in index.index_struct.nodes_dict.items())
+    ChunkStore.write([Chunk.from_node(node_by_id[nid]) for _, nid in rows])
+
+
+def indexed_vectors(index, nodes, vecs):
+    """(node_ids, normalized vectors) in FAISS row order."""
+    row_of_node = {n.node_id: i for i, n in enumerate(nodes)}
+    node_ids = [
+        nid for _, nid in sorted(
+            (int(k), v) for k, v in index.index_struct.nodes_dict.items()
+        )
+    ]
+
+    vecs = vecs[[row_of_node[nid] for nid in node_ids]]
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    return node_ids, vecs
 
-# persist FAISS
-faiss.write_index(faiss_index, os.path.join(FAISS_DIR, "vector_store.faiss"))
-docstore.persist(os.path.join(FAISS_DIR, "docstore.json"))
-index_store.persist(os.path.join(FAISS_DIR, "index_store.json"))
 
-print("📁 Vector index stored.")
+def file_entries(nodes, hashes):
+    """Manifest "files" section: hash + node ids per KB file."""
+    files = {f: {"hash": h, "node_ids": []} for f, h in hashes.items()}
+    for n in nodes:
+        files[n.metadata["file_name"]]["node_ids"].append(n.node_id)
+    return files
+
+
+def patch_policy_graph(entries, changed, removed, pending):
+    """
+    Patch the policy graph (only if one has been built) for the changed,
+    removed and policy-pending files. Files whose triple extraction
+    failed are flagged "policy_pending" in `entries`, so the next
+    incremental run retries them without re-embedding anything.
+    """
+    if not os.path.exists(POLICY_GRAPH_PATH):
+        return
+    from policy_graph_builder import update_policy_graph
+    for fname in update_policy_graph(changed, removed, pending):
+        entries[fname]["policy_pending"] = True
+
+
+def write_semantic_graph(edges):
+    with open(GRAPH_PATH, "w") as f:
+        json.dump(edges, f, indent=2)
 
 
 # =========================
-# Build semantic graph
+# Full rebuild
 # =========================
-print("🕸️ Building semantic cross-document graph...")
 
-def embed(text: str):
-    return np.array(Settings.embed_model.get_text_embedding(text))
+def full_ingest():
+    hashes = scan_kb()
+
+    print("📚 Loading knowledge base files...")
+    print("✂️ Chunking documents...")
+    nodes = load_nodes(list(hashes))
 
-emb_map = {n.node_id: embed(n.text) for n in nodes}
+    print("🧠 Loading embedding model...")
+    Settings.embed_model = SharedEmbedding()
 
-def cosine(a, b):
-    return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+    dim = embedding_dim()
+    print(f"📏 Embedding dimension: {dim}")
 
-edges = []
+    print("📦 Creating FAISS vector index...")
+    print("🧩 Building index...")
+    index, faiss_index, vecs = build_vector_index(nodes)
 
-# connect semantically related chunks, even across files
-for a, b in combinations(nodes, 2):
-    sim = cosine(emb_map[a.node_id], emb_map[b.node_id])
+    print("📁 Vector index stored.")
+
+    print("🕸️ Building semantic cross-document graph...")
+
+    # reuse the vectors computed for the index
+    node_ids, vecs = indexed_vectors(index, nodes, vecs)
+    node_by_id = {n.node_id: n for n in nodes}
+    files = [node_by_id[nid].metadata["file_name"] for nid in node_ids]
 
     # only keep strong relationships
-    if sim >= 0.60:
-        edges.append({
-            "a": a.node_id,
-            "b": b.node_id,
-            "similarity": round(sim, 3),
-            "a_file": a.metadata["file_name"],
-            "b_file": b.metadata["file_name"],
-        })
-
-graph_path = os.path.join(FAISS_DIR, "semantic_graph.json")
-
-with open(graph_path, "w") as f:
-    json.dump(edges, f, indent=2)
-
-print(f"🔗 Semantic edges created: {len(edges)}")
-print("✅ Knowledge base ingestion completed successfully.")
-print(f"🧩 Total chunks indexed: {len(nodes)}")
-print(f"📂 Stored at: {FAISS_DIR}")
\ No newline at end of file
+    edges = build_semantic_edges(node_ids, files, vecs)
+    write_semantic_graph(edges)
+
+    previous = load_manifest()
+    entries = file_entries(nodes, hashes)
+    # the policy graph is not rebuilt here: keep its pending retries
+    for fname, entry in previous.get("files", {}).items():
+        if entry.get("policy_pending") and fname in entries:
+            entries[fname]["policy_pending"] = True
+    save_manifest(entries, previous)
+
+    print(f"🔗 Semantic edges created: {len(edges)}")
+    print("✅ Knowledge base ingestion completed successfully.")
+    print(f"🧩 Total chunks indexed: {len(nodes)}")
+    print(f"📂 Stored at: {FAISS_DIR}")
+
+
+# =========================
+# Incremental update
+# =========================
+
+def incremental_ingest():
+    """
+    Re-chunk and re-embed only new/changed KB files.
+
+    Vectors of unchanged files are read back from the current FAISS index
+    and the index is rewritten from them, which drops deleted files
+    without embedding anything twice. The semantic graph (and the policy
+    graph, if one was built) are patched for the affected files only.
+    """
+    manifest = load_manifest()
+    faiss_path = os.path.join(FAISS_DIR, "vector_store.faiss")
+
+    if not manifest or not os.path.exists(faiss_path):
+        print("ℹ️ No ingest manifest found, running a full rebuild.")
+        return full_ingest()
+
+    hashes = scan_kb()
+    old_files = manifest["files"]
+
+    changed = [f for f, h in hashes.items()
+               if old_files.get(f, {}).get("hash") != h]
+    removed = [f for f in old_files if f not in hashes]
+    pending = [f for f, e in old_files.items()
+               if e.get("policy_pending") and f in hashes and f not in changed]
+
+    if not changed and not removed:
+        if pending and os.path.exists(POLICY_GRAPH_PATH):
+            # vectors are current; only the policy triples need a retry
+            print(f"🔁 Retrying policy triples for {len(pending)} file(s)")
+            entries = {f: {k: v for k, v in e.items() if k != "policy_pending"}
+                       for f, e in old_files.items()}
+            patch_policy_graph(entries, [], [], pending)
+            save_manifest(entries, manifest)
+            return
+        print("✅ Knowledge base is up to date.")
+        return
+
+    print(f"📝 Changed/new files: {len(changed)} | Removed files: {len(removed)}")
+
+    Settings.embed_model = SharedEmbedding()
+
+    # ---- keep unchanged chunks with their stored vectors ----
+    storage_context = StorageContext.from_defaults(
+        persist_dir=FAISS_DIR,
+        vector_store=FaissVectorStore.from_persist_path(faiss_path),
+    )
+    old_index = load_index_from_storage(storage_context)
+    old_faiss = old_index.vector_store.client
+    row_of = {v: int(k) for k, v in old_index.index_struct.nodes_dict.items()}
+
+    # PQ codes only approximate the vectors -> re-embed those chunks
+    if is_lossy(old_faiss):
+        print("ℹ️ Current index is product-quantized; re-embedding kept chunks.")
+    else:
+        configure_search(old_faiss)
+
+    kept = []
+    for fname, entry in old_files.items():
+        if fname in changed or fname in removed:
+            continue
+        for nid in entry["node_ids"]:
+            node = old_index.docstore.get_node(nid)
+            if not is_lossy(old_faiss):
+                node.embedding = old_faiss.reconstruct(row_of[nid]).tolist()
+            kept.append(node)
+
+    print("✂️ Chunking changed documents...")
+    new_nodes = load_nodes(changed)
+    nodes = kept + new_nodes
+
+    print("🧩 Rebuilding index (embedding new chunks only)...")
+    index, faiss_index, vecs = build_vector_index(nodes)
+
+    # ---- patch semantic graph ----
+    print("🕸️ Patching semantic graph...")
+    node_ids, vecs = indexed_vectors(index, nodes, vecs)
+    node_by_id = {n.node_id: n for n in nodes}
+    files = [node_by_id[nid].metadata["file_name"] for nid in node_ids]
+
+    # kept chunks occupy the first rows, so new edges are the ones whose
+    # second endpoint is at row >= len(kept)
+    kept_ids = {n.node_id for n in kept}
+
+    edges = []
+    if os.path.exists(GRAPH_PATH):
+        with open(GRAPH_PATH) as f:
+            edges = [e for e in json.load(f)
+                     if e["a"] in kept_ids and e["b"] in kept_ids]
+
+    edges += build_semantic_edges(node_ids, files, vecs, min_col=len(kept))
+    write_semantic_graph(edges)
+
+    # ---- patch policy graph (only if one has been built) ----
+    entries = file_entries(nodes, hashes)
+    patch_policy_graph(entries, changed, removed, pending)
+
+    save_manifest(entries, manifest)
+
+    print(f"🔗 Semantic edges: {len(edges)}")
+    print(f"🧩 Total chunks indexed: {len(nodes)} ({len(new_nodes)} re-embedded)")
+    print("✅ Incremental ingestion completed successfully.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the KB vector index.")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only re-ingest KB files whose content hash changed",
+    )
+    args = parser.parse_args()
+
+    if args.incremental:
+        incremental_ingest()
+    else:
+        full_ingest()
@@ -1,10 +1,81 @@
 import os
+import json
+import time
+import hashlib
 
 KB_DIR = "kb"
+MANIFEST_PATH = os.path.join("faiss_store", "kb_manifest.json")
 
 def get_kb_last_modified() -> float:
     latest = 0.0
     for root, _, files in os.walk(KB_DIR):
         for f in files:
             latest = max(latest, os.path.getmtime(os.path.join(root, f)))
-    return latest
\ No newline at end of file
+    return latest
+
+
+def file_hash(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def scan_kb() -> dict:
+    """
+    {file_name: sha256} for every (non-hidden) file in KB_DIR,
+    matching what SimpleDirectoryReader picks up.
+    """
+    hashes = {}
+    for fname in sorted(os.listdir(KB_DIR)):
+        path = os.path.join(KB_DIR, fname)
+        if fname.startswith(".") or not os.path.isfile(path):
+            continue
+        hashes[fname] = file_hash(path)
+    return hashes
+
+
+# -----------------------------
+# Ingest manifest
+# -----------------------------
+# {
+#   "version": int,          # bumped on every successful ingest
+#   "updated": float,        # unix time of that ingest
+#   "files": {file_name: {"hash": sha256, "node_ids": [...],
+#                         "policy_pending": true}}   # triples to retry
+# }
+
+def load_manifest() -> dict:
+    if not os.path.exists(MANIFEST_PATH):
+        return {}
+    with open(MANIFEST_PATH, "r") as f:
+        return json.load(f)
+
+
+def save_manifest(files: dict, previous: dict = None) -> dict:
+    manifest = {
+        "version": (previous or {}).get("version", 0) + 1,
+        "updated": time.time(),
+        "files": files,
+    }
+    tmp = MANIFEST_PATH + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, MANIFEST_PATH)
+    return manifest
+
+
+def bump_manifest_version() -> dict:
+    """
+    Bump the KB version without touching the file entries, for outputs
+    built outside ingest (policy graph) that the listener must reload.
+    """
+    previous = load_manifest()
+    if not previous:
+        return {}
+    return save_manifest(previous.get("files", {}), previous)
+
+
+def get_manifest_version() -> int:
+    return load_manifest().get("version", 0)
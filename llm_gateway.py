@@ -0,0 +1,456 @@
+"""
+Shared async gateway for every Ollama call made by one process.
+
+- one connection-pooled httpx.AsyncClient on a background event loop
+- a concurrency limit (LLM_MAX_CONCURRENCY worker tasks)
+- a priority queue: live replies go before batch / background calls
+- coalescing: identical in-flight prompts share one request
+- streaming with a caller-supplied stop condition (the connection is
+  closed as soon as it is met, which makes Ollama stop generating)
+- per-call latency / time-to-first-token / token-throughput stats
+
+Sync code calls `complete()`; async code awaits `acomplete()`.
+
+The limit and the priority queue are per process: the listener, every
+forked answer worker (worker_pool.py), batch_answer.py and a graph build
+in ingest_kb.py / policy_graph_builder.py each run their own gateway.
+Ollama can therefore see several processes' LLM_MAX_CONCURRENCY requests
+at once, and a live reply only jumps background work queued in the same
+process (Ollama's OLLAMA_NUM_PARALLEL is the host-wide cap).
+"""
+
+import os
+import json
+import time
+import asyncio
+import threading
+
+import httpx
+
+import metrics
+from config import (
+    OLLAMA_BASE_URL,
+    OLLAMA_MODEL,
+    LLM_MAX_CONCURRENCY,
+    LLM_TIMEOUT,
+)
+
+
+PRIORITY_LIVE = 0           # email replies
+PRIORITY_BATCH = 1          # batch_answer.py runs
+PRIORITY_BACKGROUND = 2     # policy graph builds
+
+
+class Completion:
+    """Result of one generate call (`.text`, like a LlamaIndex response)."""
+
+    __slots__ = ("text", "prompt_tokens", "completion_tokens",
+                 "latency", "queue_wait", "gen_seconds", "ttft", "stopped")
+
+    def __init__(self, text, prompt_tokens=0, completion_tokens=0,
+                 latency=0.0, queue_wait=0.0, gen_seconds=0.0,
+                 ttft=None, stopped=False):
+        self.text = text
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.latency = latency
+        self.queue_wait = queue_wait
+        self.gen_seconds = gen_seconds
+        self.ttft = ttft            # seconds to first streamed token
+        self.stopped = stopped      # True if the stop condition cut it short
+
+    def __str__(self):
+        return self.text
+
+
+class GatewayStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.coalesced = 0
+        self.latency = 0.0
+        self.max_latency = 0.0
+        self.queue_wait = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.gen_seconds = 0.0
+        self.streamed = 0
+        self.stopped_early = 0
+        self.ttft = 0.0
+        self.by_priority = {}
+        self._lock = threading.Lock()
+
+    def record(self, priority, c: Completion):
+        with self._lock:
+            self.calls += 1
+            self.latency += c.latency
+            self.max_latency = max(self.max_latency, c.latency)
+            self.queue_wait += c.queue_wait
+            self.prompt_tokens += c.prompt_tokens
+            self.completion_tokens += c.completion_tokens
+            self.gen_seconds += c.gen_seconds
+            if c.ttft is not None:
+                self.streamed += 1
+                self.ttft += c.ttft
+                self.stopped_early += c.stopped
+            self.by_priority[priority] = self.by_priority.get(priority, 0) + 1
+
+        metrics.inc("llm_requests", priority=priority)
+        metrics.inc("llm_tokens", c.prompt_tokens, kind="prompt")
+        metrics.inc("llm_tokens", c.completion_tokens, kind="completion")
+        metrics.observe("llm_completion_tokens", c.completion_tokens,
+                        buckets=metrics.TOKEN_BUCKETS)
+        metrics.observe("llm_latency_seconds", c.latency, priority=priority)
+        metrics.observe("llm_queue_wait_seconds", c.queue_wait)
+        if c.ttft is not None:
+            metrics.observe("llm_ttft_seconds", c.ttft)
+
+    def summary(self):
+        with self._lock:
+            calls = self.calls or 1
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "coalesced": self.coalesced,
+                "avg_latency": self.latency / calls,
+                "max_latency": self.max_latency,
+                "avg_queue_wait": self.queue_wait / calls,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "tokens_per_sec": (
+                    self.completion_tokens / self.gen_seconds
+                    if self.gen_seconds else 0.0
+                ),
+                "avg_ttft": self.ttft / self.streamed if self.streamed else 0.0,
+                "stopped_early": self.stopped_early,
+                "by_priority": dict(self.by_priority),
+            }
+
+
+class LLMGateway:
+    def __init__(self, base_url=OLLAMA_BASE_URL, model=OLLAMA_MODEL,
+                 max_concurrency=LLM_MAX_CONCURRENCY, timeout=LLM_TIMEOUT):
+        self.base_url = base_url
+        self.model = model
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
+        self.stats = GatewayStats()
+
+        self._seq = 0
+        self._inflight = {}
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever,
+            name="llm-gateway",
+            daemon=True,
+        )
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._setup(), self._loop).result()
+
+    async def _setup(self):
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=self.timeout,
+            limits=httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency,
+            ),
+        )
+        self._queue = asyncio.PriorityQueue()
+        self._workers = [
+            asyncio.ensure_future(self._worker())
+            for _ in range(self.max_concurrency)
+        ]
+
+    # -----------------------------
+    # request handling (gateway loop)
+    # -----------------------------
+
+    async def _submit(self, prompt, priority, options, stop=None):
+        # streamed calls only coalesce with ones using the same stop rule
+        stop_name = getattr(stop, "__qualname__", None) if stop else None
+        key = json.dumps([self.model, prompt, options, stop_name], sort_keys=True)
+
+        fut = self._inflight.get(key)
+        if fut is not None:
+            self.stats.coalesced += 1
+            metrics.inc("llm_coalesced")
+            return await asyncio.shield(fut)
+
+        fut = self._loop.create_future()
+        self._inflight[key] = fut
+
+        self._seq += 1
+        await self._queue.put(
+            (priority, self._seq, key, prompt, options, stop, time.monotonic())
+        )
+        return await asyncio.shield(fut)
+
+    async def _generate(self, prompt, options):
+        resp = await self._client.post("/api/generate", json={
+            "model": self.model,
+            "prompt": prompt,
+            "stream": False,
+            "options": options,
+        })
+        resp.raise_for_status()
+        return resp.json()
+
+    async def _stream(self, prompt, options, stop):
+        """
+        Streamed generate call. Stops reading (and closes the connection)
+        once `stop(text_so_far)` is true. Returns the final stats dict in
+        the same shape as _generate, plus "ttft" / "stopped".
+        """
+        started = time.monotonic()
+        first = None
+        parts = []
+        tokens = 0
+        data = {}
+
+        async with self._client.stream("POST", "/api/generate", json={
+            "model": self.model,
+            "prompt": prompt,
+            "stream": True,
+            "options": options,
+        }) as resp:
+            resp.raise_for_status()
+            async for line in resp.aiter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if data.get("done"):
+                    break
+
+                piece = data.get("response", "")
+                if piece and first is None:
+                    first = time.monotonic()
+                parts.append(piece)
+                tokens += 1
+
+                if stop("".join(parts)):
+                    break
+
+        stopped = not data.get("done", False)
+        if stopped:
+            # no final stats when cut short: one streamed chunk ~ one token
+            data = {
+                "eval_count": tokens,
+                "eval_duration": (time.monotonic() - (first or started)) * 1e9,
+            }
+
+        data["response"] = "".join(parts)
+        data["ttft"] = (first or time.monotonic()) - started
+        data["stopped"] = stopped
+        return data
+
+    async def _worker(self):
+        while True:
+            priority, _, key, prompt, options, stop, queued = await self._queue.get()
+            fut = self._inflight[key]
+            started = time.monotonic()
+
+            try:
+                if stop is None:
+                    data = await self._generate(prompt, options)
+                else:
+                    data = await self._stream(prompt, options, stop)
+                result = Completion(
+                    data.get("response", ""),
+                    prompt_tokens=data.get("prompt_eval_count", 0),
+                    completion_tokens=data.get("eval_count", 0),
+                    latency=time.monotonic() - started,
+                    queue_wait=started - queued,
+                    gen_seconds=data.get("eval_duration", 0) / 1e9,
+                    ttft=data.get("ttft"),
+                    stopped=data.get("stopped", False),
+                )
+                self.stats.record(priority, result)
+                fut.set_result(result)
+            except Exception as e:
+                self.stats.errors += 1
+                metrics.inc("llm_errors")
+                fut.set_exception(e)
+            finally:
+                self._inflight.pop(key, None)
+                self._queue.task_done()
+
+    # -----------------------------
+    # public API
+    # -----------------------------
+
+    async def acomplete(self, prompt, priority=PRIORITY_LIVE, **options):
+        """Awaitable from any event loop."""
+        coro = self._submit(prompt, priority, options)
+        try:
+            if asyncio.get_running_loop() is self._loop:
+                return await coro
+        except RuntimeError:
+            pass
+        return await asyncio.wrap_future(
+            asyncio.run_coroutine_threadsafe(coro, self._loop)
+        )
+
+    def complete(self, prompt, priority=PRIORITY_LIVE, **options) -> Completion:
+        """Blocking call for sync code (runs on the gateway loop)."""
+        return asyncio.run_coroutine_threadsafe(
+            self._submit(prompt, priority, options), self._loop
+        ).result()
+
+    def stream(self, prompt, stop, priority=PRIORITY_LIVE, **options) -> Completion:
+        """
+        Blocking streamed call: generation ends as soon as `stop(text)`
+        returns true for the text received so far (or at num_predict).
+        """
+        return asyncio.run_coroutine_threadsafe(
+            self._submit(prompt, priority, options, stop), self._loop
+        ).result()
+
+    def close(self):
+        async def _close():
+            for w in self._workers:
+                w.cancel()
+            await self._client.aclose()
+
+        asyncio.run_coroutine_threadsafe(_close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+_gateway = None
+_lock = threading.Lock()
+
+
+def get_gateway() -> LLMGateway:
+    global _gateway
+    if _gateway is None:
+        with _lock:
+            if _gateway is None:
+                _gateway = LLMGateway()
+    return _gateway
+
+
+def configure_gateway(**options) -> LLMGateway:
+    """
+    Replace this process's gateway with LLMGateway(**options), e.g.
+    max_concurrency for a batch run; call it before the first LLM request.
+    """
+    global _gateway
+    with _lock:
+        if _gateway is not None:
+            _gateway.close()
+        _gateway = LLMGateway(**options)
+    return _gateway
+
+
+def _reset_after_fork():
+    # the event loop thread does not survive fork(): a forked worker
+    # starts its own gateway on first use
+    global _gateway, _lock
+    _gateway = None
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class GatewayLLM:
+    """
+    Drop-in for the per-module `Ollama(...)` instances: fixed options and
+    priority, `.complete(prompt)` -> Completion with `.text`.
+    """
+
+    def __init__(self, priority=PRIORITY_LIVE, **options):
+        self.priority = priority
+        self.options = options
+
+    def complete(self, prompt, priority=None) -> Completion:
+        if priority is None:
+            priority = self.priority
+        return get_gateway().complete(prompt, priority, **self.options)
+
+    async def acomplete(self, prompt, priority=None) -> Completion:
+        if priority is None:
+            priority = self.priority
+        return await get_gateway().acomplete(prompt, priority, **self.options)
+
+    def stream(self, prompt, stop, priority=None) -> Completion:
+        if priority is None:
+            priority = self.priority
+        return get_gateway().stream(prompt, stop, priority, **self.options)
+
+
+# -----------------------------
+# LOCAL TEST
+# -----------------------------
+# Against a fake Ollama server on a free local port (no model needed):
+#   python llm_gateway.py
+
+if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    seen = []       # prompts in the order the fake server received them
+
+    class FakeOllama(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            prompt = body["prompt"]
+            seen.append(prompt)
+            time.sleep(0.3)
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+
+            if not body["stream"]:
+                self.wfile.write(json.dumps({
+                    "response": f"echo {prompt}", "done": True,
+                    "prompt_eval_count": 5, "eval_count": 3,
+                    "eval_duration": 300_000_000,
+                }).encode())
+                return
+
+            try:
+                for word in "One. Two. Three. Four. Five.".split():
+                    line = {"response": word + " ", "done": False}
+                    self.wfile.write((json.dumps(line) + "\n").encode())
+                    self.wfile.flush()
+                    time.sleep(0.05)
+                self.wfile.write(b'{"done": true, "eval_count": 5}\n')
+            except OSError:
+                pass    # the gateway hung up early
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOllama)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    gw = LLMGateway(base_url=f"http://127.0.0.1:{server.server_address[1]}",
+                    model="fake", max_concurrency=1)
+
+    with ThreadPoolExecutor(4) as pool:
+        # identical in-flight prompts share one request
+        same = [pool.submit(gw.complete, "same") for _ in range(2)]
+        assert [f.result().text for f in same] == ["echo same"] * 2
+        assert seen.count("same") == 1 and gw.stats.coalesced == 1
+
+        # with the only worker busy, a live call jumps the background one
+        busy = pool.submit(gw.complete, "busy")
+        time.sleep(0.1)
+        background = pool.submit(gw.complete, "background", PRIORITY_BACKGROUND)
+        time.sleep(0.05)
+        live = pool.submit(gw.complete, "live", PRIORITY_LIVE)
+        for f in (busy, background, live):
+            f.result()
+        assert seen[-2:] == ["live", "background"], seen
+
+    # streaming stops once the stop rule is met
+    c = gw.stream("stream", lambda text: text.count(".") >= 2)
+    assert c.text.strip() == "One. Two.", c.text
+    assert c.stopped and c.ttft is not None
+
+    print(f"🤖 {gw.stats.summary()}")
+    gw.close()
+    server.shutdown()
+    print("✅ LLM gateway OK")
@@ -0,0 +1,159 @@
+import time
+import queue
+import threading
+import traceback
+
+import metrics
+
+
+_STOP = object()
+
+
+# -----------------------------
+# Stage statistics
+# -----------------------------
+
+class StageStats:
+    """Per-stage counters and busy time (thread-safe)."""
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.errors = 0
+        self.dropped = 0
+        self.busy = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds, error=False, dropped=False):
+        with self._lock:
+            self.count += 1
+            self.busy += seconds
+            self.max = max(self.max, seconds)
+            if error:
+                self.errors += 1
+            if dropped:
+                self.dropped += 1
+
+    def line(self):
+        avg = self.busy / self.count if self.count else 0.0
+        return (
+            f"{self.name:<8} n={self.count:<4} avg={avg:6.2f}s "
+            f"max={self.max:6.2f}s busy={self.busy:7.1f}s "
+            f"dropped={self.dropped} errors={self.errors}"
+        )
+
+
+# -----------------------------
+# Stages & pipeline
+# -----------------------------
+
+class Stage:
+    """
+    One pipeline step run by `workers` threads.
+
+    `fn(job)` mutates the job and returns True to pass it on, or False
+    to finish it early (e.g. skipped emails).
+    """
+
+    def __init__(self, name, fn, workers=1):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.stats = StageStats(name)
+        self.inbox = None
+        self.threads = []
+
+
+class Pipeline:
+    """
+    Staged worker pipeline with bounded queues between stages.
+
+    put() blocks once the first queue is full and every stage blocks on
+    a full downstream queue, so a slow stage (the LLM) throttles the ones
+    before it instead of buffering the whole inbox in memory. Every job
+    ends up in `on_done(job)` exactly once: after the last stage, when a
+    stage drops it, or when a stage raises.
+    """
+
+    def __init__(self, stages, on_done, maxsize=16):
+        self.stages = stages
+        self.on_done = on_done
+        self.extra = {}
+        self.started = None
+
+        for stage in stages:
+            stage.inbox = queue.Queue(maxsize=maxsize)
+
+    def start(self):
+        self.started = time.time()
+        for i, stage in enumerate(self.stages):
+            nxt = self.stages[i + 1] if i + 1 < len(self.stages) else None
+            for w in range(stage.workers):
+                t = threading.Thread(
+                    target=self._run,
+                    args=(stage, nxt),
+                    name=f"{stage.name}-{w}",
+                    daemon=True,
+                )
+                t.start()
+                stage.threads.append(t)
+
+    def put(self, job):
+        self.stages[0].inbox.put(job)
+
+    def record(self, name, seconds):
+        """Time work done outside the worker stages (e.g. IMAP fetch)."""
+        if name not in self.extra:
+            self.extra[name] = StageStats(name)
+        self.extra[name].record(seconds)
+
+    def _run(self, stage, nxt):
+        while True:
+            job = stage.inbox.get()
+            if job is _STOP:
+                return
+
+            t0 = time.time()
+            try:
+                keep = stage.fn(job)
+            except Exception as e:
+                stage.stats.record(time.time() - t0, error=True)
+                metrics.inc("pipeline_errors", stage=stage.name)
+                print(f"❌ [{stage.name}] Error processing {job}: {repr(e)}")
+                traceback.print_exc()
+                self.on_done(job)
+                continue
+
+            stage.stats.record(time.time() - t0, dropped=not keep)
+
+            if keep and nxt is not None:
+                nxt.inbox.put(job)      # blocks when downstream is full
+            else:
+                self.on_done(job)
+
+    def close(self, on_tick=None, tick=5.0):
+        """
+        Drain and stop all stages in order. `on_tick` is called every
+        `tick` seconds while waiting (used to flag finished emails and
+        keep the IMAP session alive during long backlogs). A failing
+        `on_tick` is dropped, the stages are still drained.
+        """
+        for stage in self.stages:
+            for _ in stage.threads:
+                stage.inbox.put(_STOP)
+            for t in stage.threads:
+                while t.is_alive():
+                    t.join(timeout=tick)
+                    if on_tick:
+                        try:
+                            on_tick()
+                        except Exception as e:
+                            print(f"⚠️ Pipeline tick failed, draining without it: {e!r}")
+                            on_tick = None
+
+    def report(self):
+        wall = time.time() - self.started if self.started else 0.0
+        print(f"⏱️ Pipeline finished in {wall:.1f}s")
+        for stats in list(self.extra.values()) + [s.stats for s in self.stages]:
+            print("   " + stats.line())
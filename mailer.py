@@ -1,21 +1,242 @@
+import time
 import smtplib
+import threading
 from email.message import EmailMessage
 from config import (
     GMAIL_ADDRESS,
     GMAIL_APP_PASSWORD,
     SMTP_SERVER,
     SMTP_PORT,
+    SMTP_STARTTLS,
+    SMTP_POOL_SIZE,
+    SMTP_IDLE_TIMEOUT,
+    SMTP_NOOP_AFTER,
 )
 
-def send_email(to_address, subject, body):
+
+# -----------------------------
+# Connection pool
+# -----------------------------
+
+class SMTPPool:
+    """
+    Reuses authenticated SMTP sessions across sends.
+
+    - at most `size` open connections (one per concurrent sender)
+    - connections idle longer than `idle_timeout` are closed, not reused
+    - connections idle longer than `noop_after` are checked with NOOP
+    - a send that fails on a dead connection is retried once on a new one
+    """
+
+    def __init__(self, host, port, user=None, password=None,
+                 starttls=True, size=2, idle_timeout=120.0,
+                 noop_after=15.0, timeout=30.0):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.idle_timeout = idle_timeout
+        self.noop_after = noop_after
+        self.timeout = timeout
+
+        self._idle = []                         # [(conn, last_used)]
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _connect(self):
+        conn = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            conn.starttls()
+        if self.user:
+            conn.login(self.user, self.password)
+        return conn
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.quit()
+        except Exception:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _healthy(self, conn):
+        try:
+            return conn.noop()[0] == 250
+        except Exception:
+            return False
+
+    def acquire(self):
+        self._slots.acquire()
+        try:
+            while True:
+                with self._lock:
+                    if not self._idle:
+                        break
+                    conn, last_used = self._idle.pop()
+
+                idle = time.time() - last_used
+                if idle > self.idle_timeout:
+                    self._close(conn)
+                    continue
+                if idle > self.noop_after and not self._healthy(conn):
+                    self._close(conn)
+                    continue
+                return conn
+
+            return self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn, broken=False):
+        try:
+            if broken:
+                self._close(conn)
+            else:
+                with self._lock:
+                    self._idle.append((conn, time.time()))
+        finally:
+            self._slots.release()
+
+    def send(self, msg):
+        conn = self.acquire()
+        broken = False
+        try:
+            try:
+                conn.send_message(msg)
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                # stale session: reconnect once and retry
+                self._close(conn)
+                conn = None
+                conn = self._connect()
+                conn.send_message(msg)
+        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException):
+            raise       # rejected by the server; the session is still usable
+        except Exception:
+            broken = True
+            raise
+        finally:
+            # the slot is always given back, whatever failed
+            if conn is None:
+                self._slots.release()
+            else:
+                self.release(conn, broken)
+
+    def send_many(self, msgs):
+        """Send a batch over pooled sessions; returns one error (or None) per message."""
+        errors = []
+        for msg in msgs:
+            try:
+                self.send(msg)
+                errors.append(None)
+            except Exception as e:
+                errors.append(e)
+        return errors
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._close(conn)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> SMTPPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = SMTPPool(
+                    SMTP_SERVER,
+                    SMTP_PORT,
+                    user=GMAIL_ADDRESS,
+                    password=GMAIL_APP_PASSWORD,
+                    starttls=SMTP_STARTTLS,
+                    size=SMTP_POOL_SIZE,
+                    idle_timeout=SMTP_IDLE_TIMEOUT,
+                    noop_after=SMTP_NOOP_AFTER,
+                )
+    return _pool
+
+
+# -----------------------------
+# Public API
+# -----------------------------
+
+def build_message(to_address, subject, body):
     msg = EmailMessage()
     msg["From"] = GMAIL_ADDRESS
     msg["To"] = to_address
     msg["Subject"] = subject
     msg.set_content(body)
+    return msg
+
+
+def send_email(to_address, subject, body):
+    get_pool().send(build_message(to_address, subject, body))
+
+
+def send_emails(replies):
+    """
+    Batch send for draining a backlog.
+    `replies` is an iterable of (to_address, subject, body) tuples;
+    returns one error (or None) per reply, in order.
+    """
+    msgs = [build_message(to, subject, body) for to, subject, body in replies]
+    return get_pool().send_many(msgs)
+
+
+# -----------------------------
+# LOCAL TEST
+# -----------------------------
+# Against a local SMTP debugging server (no TLS / auth), e.g.
+#   python -m aiosmtpd -n -l localhost:1025
+#   python mailer.py localhost 1025
+
+if __name__ == "__main__":
+    import sys
+    import socket
+
+    host = sys.argv[1] if len(sys.argv) > 1 else "localhost"
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 1025
+    pool = SMTPPool(host, port, starttls=False, size=2)
+
+    def message(i):
+        msg = EmailMessage()
+        msg["From"] = "agent@localhost"
+        msg["To"] = "user@localhost"
+        msg["Subject"] = f"pool test {i}"
+        msg.set_content("hello")
+        return msg
+
+    # sessions are reused
+    pool.send(message(0))
+    conn = pool._idle[-1][0]
+    pool.send(message(1))
+    assert pool._idle[-1][0] is conn, "session was not reused"
+
+    # a session dropped underneath the pool is replaced transparently
+    conn.sock.shutdown(socket.SHUT_RDWR)
+    pool.send(message(2))
+    assert pool._idle[-1][0] is not conn, "dead session was reused"
 
-    with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-        server.starttls()
-        server.login(GMAIL_ADDRESS, GMAIL_APP_PASSWORD)
-        server.send_message(msg)
+    # a failed reconnect still gives its slot back
+    real_connect, pool._connect = pool._connect, lambda: 1 / 0
+    pool._idle[-1][0].sock.shutdown(socket.SHUT_RDWR)
+    for _ in range(3):
+        try:
+            pool.send(message(3))
+        except ZeroDivisionError:
+            pass
+    pool._connect = real_connect
 
+    assert pool.send_many([message(i) for i in range(4, 8)]) == [None] * 4
+    assert pool._slots._value == 2, "pool slots leaked"
+    pool.close()
+    print("✅ SMTP pool OK")
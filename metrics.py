@@ -0,0 +1,375 @@
+"""
+Lightweight tracing and metrics for the answer pipeline.
+
+    with span("retrieve"):
+        hits = ...
+    inc("emails", outcome="replied")
+    observe("llm_completion_tokens", n, buckets=TOKEN_BUCKETS)
+
+Spans time a block into one histogram (vgr_span_seconds{span=...});
+counters and histograms live in a process-wide registry that is served
+in the Prometheus text format (serve(): GET /metrics, /metrics.json) or
+dumped as JSON every METRICS_DUMP_INTERVAL seconds (start_dump()).
+
+trace() additionally collects the spans of one request on the current
+thread, for a per-email breakdown line.
+
+Forked answer workers (worker_pool.py) do not export anything: their
+observations are buffered and shipped to the parent with each finished
+job (drain() / replay()), so the listener's endpoint covers all of them.
+"""
+
+import os
+import json
+import time
+import bisect
+import threading
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PREFIX = "vgr_"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096)
+
+RATE_WINDOW = 60.0      # seconds behind the counters' per-minute rate
+
+
+# -----------------------------
+# Metric types
+# -----------------------------
+
+class Counter:
+    __slots__ = ("value", "_recent")
+
+    def __init__(self):
+        self.value = 0.0
+        self._recent = deque()          # (time, n) within RATE_WINDOW
+
+    def inc(self, n, now):
+        self.value += n
+        self._recent.append((now, n))
+        while self._recent and now - self._recent[0][0] > RATE_WINDOW:
+            self._recent.popleft()
+
+    def per_minute(self, now):
+        recent = sum(n for t, n in self._recent if now - t <= RATE_WINDOW)
+        return recent * 60.0 / RATE_WINDOW
+
+    def snapshot(self, now):
+        return {"value": self.value, "per_minute": self.per_minute(now)}
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count", "max")
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)    # last: +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile."""
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self, now=None):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "avg": self.sum / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "max": self.max,
+        }
+
+
+# -----------------------------
+# Registry
+# -----------------------------
+
+class Registry:
+    """name -> {labels tuple -> Counter | Histogram}, thread-safe."""
+
+    def __init__(self):
+        self.started = time.time()
+        self._series = {}
+        self._kinds = {}
+        self._lock = threading.Lock()
+        self._forward = None            # list: buffer for the parent process
+
+    def _get(self, kind, name, labels, buckets):
+        series = self._series.setdefault(name, {})
+        metric = series.get(labels)
+        if metric is None:
+            self._kinds[name] = kind
+            metric = series[labels] = (
+                Counter() if kind == "counter" else Histogram(buckets)
+            )
+        return metric
+
+    def record(self, kind, name, labels, value, buckets=LATENCY_BUCKETS):
+        with self._lock:
+            if self._forward is not None:
+                self._forward.append((kind, name, labels, value, buckets))
+                return
+            metric = self._get(kind, name, labels, buckets)
+            if kind == "counter":
+                metric.inc(value, time.time())
+            else:
+                metric.observe(value)
+
+    def snapshot(self):
+        now = time.time()
+        with self._lock:
+            return {
+                name: {
+                    "type": self._kinds[name],
+                    "series": [
+                        dict(labels=dict(labels), **m.snapshot(now))
+                        for labels, m in series.items()
+                    ],
+                }
+                for name, series in self._series.items()
+            }
+
+    def prometheus(self):
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._series.items()):
+                full = PREFIX + name
+                if self._kinds[name] == "counter":
+                    full += "_total"
+                lines.append(f"# TYPE {full} {self._kinds[name]}")
+
+                for labels, m in series.items():
+                    if isinstance(m, Counter):
+                        lines.append(f"{full}{_labels(labels)} {m.value:g}")
+                        continue
+
+                    cumulative = 0
+                    for bound, n in zip(m.buckets + ("+Inf",), m.counts):
+                        cumulative += n
+                        le = labels + (("le", f"{bound:g}" if bound != "+Inf" else bound),)
+                        lines.append(f"{full}_bucket{_labels(le)} {cumulative}")
+                    lines.append(f"{full}_sum{_labels(labels)} {m.sum:g}")
+                    lines.append(f"{full}_count{_labels(labels)} {m.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+_registry = Registry()
+_gauges = {}                            # name -> fn() returning {key: number}
+_local = threading.local()
+
+
+def _reset_after_fork():
+    # forked answer workers buffer for the parent instead of exporting
+    global _registry
+    _registry = Registry()
+    _registry._forward = []
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+# -----------------------------
+# Recording
+# -----------------------------
+
+def inc(name, n=1, **labels):
+    _registry.record("counter", name, tuple(sorted(labels.items())), n)
+
+
+def observe(name, value, buckets=LATENCY_BUCKETS, **labels):
+    _registry.record("histogram", name, tuple(sorted(labels.items())),
+                     value, buckets)
+
+
+@contextmanager
+def span(name):
+    """Time the block into vgr_span_seconds{span=name} (and the current trace)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        observe("span_seconds", seconds, span=name)
+        trace_ = getattr(_local, "trace", None)
+        if trace_ is not None:
+            trace_.spans.append((name, seconds))
+
+
+class Trace:
+    """Spans recorded on one thread during a trace() block."""
+
+    def __init__(self):
+        self.spans = []
+        self.seconds = 0.0
+
+    def __str__(self):
+        parts = " | ".join(f"{name} {secs:.2f}s" for name, secs in self.spans)
+        return f"{self.seconds:.2f}s ({parts})"
+
+
+@contextmanager
+def trace():
+    previous = getattr(_local, "trace", None)
+    _local.trace = t = Trace()
+    started = time.perf_counter()
+    try:
+        yield t
+    finally:
+        t.seconds = time.perf_counter() - started
+        _local.trace = previous
+
+
+def extend_trace(spans):
+    """Add (name, seconds) spans timed elsewhere (a worker process)."""
+    trace_ = getattr(_local, "trace", None)
+    if trace_ is not None:
+        trace_.spans.extend(spans)
+
+
+def add_gauges(name, fn):
+    """Export fn()'s numeric values as gauges vgr_<name>_<key> (e.g. stats())."""
+    _gauges[name] = fn
+
+
+# -----------------------------
+# Worker processes -> parent
+# -----------------------------
+
+def drain():
+    """Observations buffered in a forked worker since the last drain()."""
+    with _registry._lock:
+        events, _registry._forward = _registry._forward or [], []
+    return events
+
+
+def replay(events):
+    for event in events:
+        _registry.record(*event)
+
+
+# -----------------------------
+# Export
+# -----------------------------
+
+def _gauge_values():
+    values = {}
+    for prefix, fn in list(_gauges.items()):
+        try:
+            stats = fn()
+        except Exception:
+            continue
+        for key, value in stats.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                values[f"{prefix}_{key}"] = value
+    return values
+
+
+def snapshot():
+    return {
+        "time": time.time(),
+        "uptime": time.time() - _registry.started,
+        "metrics": _registry.snapshot(),
+        "gauges": _gauge_values(),
+    }
+
+
+def prometheus():
+    lines = [_registry.prometheus()]
+    for name, value in sorted(_gauge_values().items()):
+        lines.append(f"# TYPE {PREFIX}{name} gauge\n{PREFIX}{name} {value:g}\n")
+    return "".join(lines)
+
+
+def report():
+    """Print span latencies and counter rates (end of a mailbox pass)."""
+    data = _registry.snapshot()
+    spans = data.get("span_seconds", {}).get("series", [])
+    if spans:
+        print("⏱️ Spans:")
+        for s in sorted(spans, key=lambda s: -s["sum"]):
+            print(f"   {s['labels']['span']:<22} n={s['count']:<5} "
+                  f"avg={s['avg']:6.3f}s p95≤{s['p95']:6.3f}s max={s['max']:6.3f}s")
+
+    for name, metric in sorted(data.items()):
+        if metric["type"] != "counter":
+            continue
+        for s in metric["series"]:
+            labels = ",".join(f"{k}={v}" for k, v in s["labels"].items())
+            print(f"   {name}{'{' + labels + '}' if labels else ''} "
+                  f"{s['value']:g} ({s['per_minute']:.1f}/min)")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/metrics.json"):
+            body = json.dumps(snapshot()).encode()
+            content_type = "application/json"
+        elif self.path.startswith("/metrics"):
+            body = prometheus().encode()
+            content_type = "text/plain; version=0.0.4"
+        else:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port, host="127.0.0.1"):
+    """Serve /metrics (Prometheus) and /metrics.json on a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http",
+                     daemon=True).start()
+    print(f"📈 Metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+def _dump_forever(path, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            tmp = f"{path}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(snapshot(), f, indent=1)
+            os.replace(tmp, path)
+        except Exception as e:
+            print("⚠️ Metrics dump failed:", repr(e))
+
+
+def start_dump(path, interval):
+    """Write snapshot() to `path` every `interval` seconds."""
+    threading.Thread(target=_dump_forever, args=(path, interval),
+                     name="metrics-dump", daemon=True).start()
@@ -1,18 +1,21 @@
 import os
 import json
 import re
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from llama_index.llms.ollama import Ollama
-from config import KB_DIR, OLLAMA_MODEL
+from config import KB_DIR, OLLAMA_MODEL, POLICY_GRAPH_WORKERS
+from kb_utils import bump_manifest_version
+from policy_store import PolicyStore, load_entity_vecs
+from llm_gateway import GatewayLLM, PRIORITY_BACKGROUND
 
 GRAPH_PATH = "faiss_store/policy_graph.json"
+CACHE_PATH = "faiss_store/policy_triples_cache.jsonl"
 
-# ---- instantiate Qwen2.5:3B (or your configured model) ----
-llm = Ollama(
-    model=OLLAMA_MODEL,
-    temperature=0.0,
-    options={"num_ctx": 2048}
-)
+# ---- Qwen2.5:3B (or your configured model) via the shared gateway;
+# background priority so live email replies are served first ----
+llm = GatewayLLM(PRIORITY_BACKGROUND, temperature=0.0, num_ctx=2048)
 
 
 def safe_json_extract(text: str):
@@ -49,6 +52,9 @@ def parse_line_triples(text: str):
 def extract_triples_from_text(text: str, source_file: str):
     """
     Extract triples using a Qwen-optimized prompt.
+
+    Returns None when the model output cannot be parsed, so the chunk is
+    not checkpointed as "no triples" and is retried on the next run.
     """
 
     prompt = f"""
@@ -87,7 +93,7 @@ Text:
         print(f"⚠️ Could not parse triples for {source_file}")
         print("🔎 Model output was:")
         print(response)
-        return []
+        return None
 
     # ---------- Normalize ----------
 
@@ -114,36 +120,203 @@ def chunk_text(text: str, size=900):
         yield " ".join(words[i:i + size])
 
 
-def build_policy_graph():
-    """
-    Main builder: walks KB, extracts triples, writes JSON.
+def kb_files():
+    return sorted(
+        f for f in os.listdir(KB_DIR)
+        if f.endswith((".md", ".txt"))
+    )
+
+
+# -----------------------------
+# Per-chunk checkpoint cache
+# -----------------------------
+
+def chunk_key(chunk: str) -> str:
+    """Content hash of a chunk (model name included: new model, new triples)."""
+    return hashlib.sha256(f"{OLLAMA_MODEL}\n{chunk}".encode("utf-8")).hexdigest()
+
+
+class TripleCache:
     """
+    Append-only JSONL checkpoint, one line per extracted chunk:
+        {"key": <chunk hash>, "triples": [...]}
 
-    all_triples = []
+    Every finished chunk is flushed immediately, so an interrupted build
+    resumes where it stopped and unchanged chunks are never re-sent.
+    """
 
-    for fname in os.listdir(KB_DIR):
-        if not fname.endswith((".md", ".txt")):
-            continue
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        row = json.loads(line)
+                    except ValueError:
+                        continue        # torn last line of a killed run
+                    self.entries[row["key"]] = row["triples"]
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def put(self, key, triples):
+        line = json.dumps({"key": key, "triples": triples}, ensure_ascii=False)
+        with self._lock:
+            self.entries[key] = triples
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                f.flush()
+
+    def compact(self, keep):
+        """Rewrite the checkpoint with only the keys still in the KB."""
+        with self._lock:
+            self.entries = {k: v for k, v in self.entries.items() if k in keep}
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                for k, v in self.entries.items():
+                    f.write(json.dumps({"key": k, "triples": v},
+                                       ensure_ascii=False) + "\n")
+            os.replace(tmp, self.path)
+
+
+# -----------------------------
+# Parallel extraction
+# -----------------------------
+
+def extract_files(fnames, cache=None, workers=POLICY_GRAPH_WORKERS):
+    """
+    Extract triples for every chunk of the given KB files.
 
-        path = os.path.join(KB_DIR, fname)
+    Chunks already in the checkpoint cache are reused; the rest are sent
+    to the LLM through a bounded worker pool. Returns the triples in
+    file / chunk order, the set of chunk keys seen and the set of files
+    with a chunk whose extraction failed.
+    """
+    cache = cache or TripleCache()
 
-        with open(path, encoding="utf-8") as f:
+    tasks = []                                  # (fname, chunk, key)
+    for fname in fnames:
+        with open(os.path.join(KB_DIR, fname), encoding="utf-8") as f:
             text = f.read()
+        for chunk in chunk_text(text):
+            tasks.append((fname, chunk, chunk_key(chunk)))
+
+    todo = {}
+    for fname, chunk, key in tasks:
+        if cache.get(key) is None and key not in todo:
+            todo[key] = (fname, chunk)
+
+    print(f"📄 {len(tasks)} chunks in {len(fnames)} files "
+          f"({len(tasks) - len(todo)} cached, {len(todo)} to extract)")
+
+    if todo:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = {
+                pool.submit(extract_triples_from_text, chunk, fname): key
+                for key, (fname, chunk) in todo.items()
+            }
+            for done, fut in enumerate(as_completed(futures), 1):
+                key = futures[fut]
+                try:
+                    triples = fut.result()
+                except Exception as e:
+                    # not cached -> retried on the next run
+                    print(f"❌ Extraction failed for {todo[key][0]}: {repr(e)}")
+                    continue
+                if triples is None:
+                    # unparseable output: also not cached
+                    continue
+
+                cache.put(key, [
+                    {k: t[k] for k in ("subject", "relation", "object")}
+                    for t in triples
+                ])
+                print(f"  ✔ {done}/{len(todo)} chunks ({todo[key][0]})")
+
+    all_triples = []
+    failed = set()
+    for fname, _, key in tasks:
+        triples = cache.get(key)
+        if triples is None:
+            failed.add(fname)
+        for t in triples or []:
+            all_triples.append({"file": fname, **t})
 
-        print(f"📄 Processing {fname} ...")
+    return all_triples, {key for _, _, key in tasks}, failed
 
-        for chunk in chunk_text(text):
-            triples = extract_triples_from_text(chunk, fname)
-            all_triples.extend(triples)
 
+def save_policy_graph(all_triples):
     os.makedirs("faiss_store", exist_ok=True)
 
     with open(GRAPH_PATH, "w", encoding="utf-8") as f:
         json.dump(all_triples, f, indent=2, ensure_ascii=False)
 
+    # entity phrase embeddings, so the agent maps them instead of
+    # embedding every phrase on load (unchanged phrases are reused)
+    store = PolicyStore(all_triples, load_entity_vecs(GRAPH_PATH))
+    store.save_entity_vecs(GRAPH_PATH)
+
     print(f"🕸️ Policy graph saved to {GRAPH_PATH}")
     print(f"✔ Extracted triples: {len(all_triples)}")
 
 
+def build_policy_graph(bump_version=True):
+    """
+    Main builder: walks KB, extracts triples, writes JSON.
+
+    Bumps the KB manifest version so a running listener hot-reloads the
+    new facts and stops serving cached answers built on the old ones
+    (incremental ingest passes False: it saves the manifest itself).
+    """
+
+    cache = TripleCache()
+    all_triples, keys, _ = extract_files(kb_files(), cache)
+
+    save_policy_graph(all_triples)
+    cache.compact(keys)
+
+    if bump_version:
+        manifest = bump_manifest_version()
+        if manifest:
+            print(f"🔖 KB version bumped to {manifest['version']}")
+
+
+def update_policy_graph(changed, removed, pending=()):
+    """
+    Patch the policy graph after an incremental ingest: drop triples of
+    changed/removed files and re-extract only the changed ones, plus the
+    unchanged `pending` files (manifest "policy_pending": their last
+    extraction failed).
+
+    A file with a chunk whose extraction failed keeps its old triples.
+    The failed files are returned, so the caller can flag them pending
+    and have the next run retry them.
+    """
+    if not os.path.exists(GRAPH_PATH):
+        build_policy_graph(bump_version=False)
+        return []
+
+    with open(GRAPH_PATH, encoding="utf-8") as f:
+        all_triples = json.load(f)
+
+    changed = [f for f in list(changed) + list(pending)
+               if f.endswith((".md", ".txt"))]
+    new_triples, _, failed = extract_files(changed)
+
+    stale = (set(changed) - failed) | set(removed)
+    all_triples = [t for t in all_triples if t["file"] not in stale]
+    all_triples.extend(t for t in new_triples if t["file"] not in failed)
+
+    save_policy_graph(all_triples)
+    if failed:
+        print(f"⚠️ Triple extraction failed for {len(failed)} file(s), "
+              f"kept their old triples: {', '.join(sorted(failed))}")
+    return sorted(failed)
+
+
 if __name__ == "__main__":
     build_policy_graph()
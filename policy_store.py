@@ -0,0 +1,207 @@
+import os
+import re
+import json
+from collections import defaultdict
+
+import numpy as np
+
+from config import EMBEDDING_MODEL_NAME
+from embeddings import embed
+
+
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "to", "in", "on", "for", "is",
+    "are", "be", "by", "at", "from", "with", "my", "i", "can", "if",
+    "it", "do", "does", "will", "after", "before", "what", "when", "how",
+    "you", "your", "am", "was", "this", "that", "still",
+}
+
+
+def tokenize(text: str):
+    return [
+        t for t in re.findall(r"[a-z0-9]+", text.lower())
+        if t not in STOPWORDS and len(t) > 1
+    ]
+
+
+def entity_paths(path):
+    """(matrix .npy, phrase list .json) stored next to the graph JSON."""
+    base = os.path.splitext(path)[0]
+    return base + "_entities.npy", base + "_entities.json"
+
+
+def load_entity_vecs(path):
+    """
+    (phrases, memory-mapped matrix) saved for the graph at `path`, or None
+    when missing, unreadable or built with another embedding model.
+    """
+    vecs_path, meta_path = entity_paths(path)
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        vecs = np.load(vecs_path, mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+
+    if meta.get("model") != EMBEDDING_MODEL_NAME or \
+            len(vecs) != len(meta.get("entities", ())):
+        return None
+    return meta["entities"], vecs
+
+
+class PolicyStore:
+    """
+    Compact, indexed store of the subject/relation/object triples written
+    by policy_graph_builder.py.
+
+    - entity/relation/file strings are interned once; triples are int32
+      columns pointing into that string table
+    - inverted indexes: entity -> triples (as subject / as object) and
+      token -> triples
+    - an embedding matrix over entity phrases for semantic entity lookup,
+      precomputed at graph build time (save_entity_vecs) and memory-mapped
+      on load; only phrases missing from the saved matrix are embedded
+    """
+
+    def __init__(self, triples, saved_vecs=None):
+        self.strings = []
+        self._intern = {}
+
+        subj, rel, obj, files = [], [], [], []
+        for t in triples:
+            subj.append(self._id(t["subject"]))
+            rel.append(self._id(t["relation"]))
+            obj.append(self._id(t["object"]))
+            files.append(self._id(t.get("file", "")))
+
+        self.subj = np.asarray(subj, dtype=np.int32)
+        self.rel = np.asarray(rel, dtype=np.int32)
+        self.obj = np.asarray(obj, dtype=np.int32)
+        self.file = np.asarray(files, dtype=np.int32)
+
+        self.by_subject = defaultdict(list)
+        self.by_object = defaultdict(list)
+        self.by_token = defaultdict(set)
+
+        for tid in range(len(self.subj)):
+            s, r, o = int(self.subj[tid]), int(self.rel[tid]), int(self.obj[tid])
+            self.by_subject[s].append(tid)
+            self.by_object[o].append(tid)
+            for sid in (s, r, o):
+                for tok in tokenize(self.strings[sid]):
+                    self.by_token[tok].add(tid)
+
+        # entity phrase embeddings (subjects + objects)
+        self.entity_ids = np.unique(np.concatenate([self.subj, self.obj])) \
+            if len(self.subj) else np.zeros(0, dtype=np.int32)
+        self.entity_vecs = (
+            self._entity_matrix(saved_vecs)
+            if len(self.entity_ids) else None
+        )
+
+    def _id(self, s: str) -> int:
+        s = s.strip()
+        sid = self._intern.get(s)
+        if sid is None:
+            sid = len(self.strings)
+            self._intern[s] = sid
+            self.strings.append(s)
+        return sid
+
+    def entity_phrases(self):
+        return [self.strings[i] for i in self.entity_ids]
+
+    def _entity_matrix(self, saved):
+        """Entity phrase embeddings, reusing rows of a saved (phrases, vecs)."""
+        phrases = self.entity_phrases()
+        if saved is None:
+            return embed(phrases)
+
+        saved_phrases, saved_vecs = saved
+        if saved_phrases == phrases:
+            return saved_vecs
+
+        row = {p: i for i, p in enumerate(saved_phrases)}
+        missing = [p for p in phrases if p not in row]
+        fresh = dict(zip(missing, embed(missing)))
+        return np.stack([
+            saved_vecs[row[p]] if p in row else fresh[p] for p in phrases
+        ]).astype(np.float32)
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path):
+            return cls([])
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f), load_entity_vecs(path))
+
+    def save_entity_vecs(self, path):
+        """Write the entity matrix next to the graph JSON at `path`."""
+        vecs_path, meta_path = entity_paths(path)
+        vecs = self.entity_vecs
+        if vecs is None:
+            vecs = np.zeros((0, 0), dtype=np.float32)
+
+        # new files + rename: a process with the old matrix mapped keeps it
+        with open(vecs_path + ".tmp", "wb") as f:
+            np.save(f, np.ascontiguousarray(vecs, dtype=np.float32))
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"model": EMBEDDING_MODEL_NAME,
+                       "entities": self.entity_phrases()}, f, ensure_ascii=False)
+        os.replace(vecs_path + ".tmp", vecs_path)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    def __len__(self):
+        return len(self.subj)
+
+    # -----------------------------
+    # lookup
+    # -----------------------------
+
+    def triples_for_entity(self, entity: str):
+        sid = self._intern.get(entity.strip())
+        if sid is None:
+            return []
+        return sorted(set(self.by_subject.get(sid, [])) |
+                      set(self.by_object.get(sid, [])))
+
+    def fact(self, tid: int) -> str:
+        return " ".join((
+            self.strings[self.subj[tid]],
+            self.strings[self.rel[tid]],
+            self.strings[self.obj[tid]],
+        ))
+
+    def source(self, tid: int) -> str:
+        return self.strings[self.file[tid]]
+
+    def lookup(self, question, q_vec=None, k=5, entity_threshold=0.5):
+        """
+        Best-matching policy facts for a question: token overlap with the
+        triple text plus cosine similarity of the question to the
+        triple's subject/object phrases. Returns [(fact, file, score)].
+        """
+        if len(self) == 0:
+            return []
+
+        scores = np.zeros(len(self), dtype=np.float32)
+
+        q_tokens = set(tokenize(question))
+        for tok in q_tokens:
+            for tid in self.by_token.get(tok, ()):
+                scores[tid] += 1.0 / len(q_tokens)
+
+        if q_vec is not None and self.entity_vecs is not None:
+            sims = self.entity_vecs @ np.asarray(q_vec, dtype=np.float32)
+            for pos in np.nonzero(sims >= entity_threshold)[0]:
+                eid, sim = int(self.entity_ids[pos]), float(sims[pos])
+                for tid in self.by_subject.get(eid, ()):
+                    scores[tid] += sim
+                for tid in self.by_object.get(eid, ()):
+                    scores[tid] += sim
+
+        top = np.argsort(-scores)[:k]
+        return [
+            (self.fact(int(t)), self.source(int(t)), float(scores[t]))
+            for t in top if scores[t] > 0
+        ]
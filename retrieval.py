@@ -0,0 +1,126 @@
+"""
+Lean retrieval engine: question -> embedding -> faiss.search -> chunks.
+
+Built once per index load. The chunk table maps a FAISS row to its text
+and file name (a list lookup here, or a read from the memory-mapped
+ChunkStore in chunk_store.py) instead of LlamaIndex's retriever /
+docstore round trip.
+"""
+
+import numpy as np
+
+from embeddings import embed
+
+
+class Chunk:
+    """One indexed chunk (the subset of a LlamaIndex node the agent uses)."""
+
+    __slots__ = ("node_id", "text", "file_name", "prev_id", "next_id")
+
+    def __init__(self, node_id, text, file_name, prev_id=None, next_id=None):
+        self.node_id = node_id
+        self.text = text
+        self.file_name = file_name
+        self.prev_id = prev_id
+        self.next_id = next_id
+
+    @classmethod
+    def from_node(cls, node):
+        prev, nxt = node.prev_node, node.next_node
+        return cls(
+            node.node_id,
+            node.text,
+            (node.metadata or {}).get("file_name", "Unknown"),
+            prev.node_id if prev else None,
+            nxt.node_id if nxt else None,
+        )
+
+    @property
+    def metadata(self):
+        return {"file_name": self.file_name}
+
+
+class Hit:
+    """Search result; same `.node` / `.score` shape as NodeWithScore."""
+
+    __slots__ = ("node", "score", "row", "expanded")
+
+    def __init__(self, node, score, row, expanded=False):
+        self.node = node
+        self.score = score
+        self.row = row
+        self.expanded = expanded    # added by graph expansion, not FAISS
+
+
+class ChunkTable:
+    """
+    Chunks in FAISS row order plus a node id -> row map, all in memory.
+    Fallback for indexes ingested before the ChunkStore export existed.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.row_of = {c.node_id: i for i, c in enumerate(chunks)}
+
+    @classmethod
+    def from_index(cls, index):
+        """Read every indexed node from a LlamaIndex docstore once."""
+        nodes_dict = index.index_struct.nodes_dict
+        docstore = index.docstore
+
+        chunks = [None] * len(nodes_dict)
+        for row, node_id in nodes_dict.items():
+            chunks[int(row)] = Chunk.from_node(docstore.get_node(node_id))
+
+        return cls(chunks)
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def chunk(self, row):
+        return self.chunks[row]
+
+    def hit(self, node_id, score):
+        row = self.row_of[node_id]
+        return Hit(self.chunks[row], score, row)
+
+    def adjacent_pairs(self):
+        """(chunk, next chunk) id pairs for the graph's prev/next edges."""
+        return [(c.node_id, c.next_id) for c in self.chunks if c.next_id]
+
+
+class RetrievalEngine:
+    def __init__(self, faiss_index, table):
+        """`table`: ChunkTable or ChunkStore (anything with .chunk(row))."""
+        self.faiss_index = faiss_index
+        self.table = table
+
+    def search(self, q_vecs, k):
+        """Top-k hits for each row of an (m, dim) query matrix."""
+        q_vecs = np.ascontiguousarray(q_vecs, dtype=np.float32)
+        scores, rows = self.faiss_index.search(q_vecs, k)
+
+        chunk = self.table.chunk
+        return [
+            [
+                Hit(chunk(int(r)), float(s), int(r))
+                for s, r in zip(score_row, row_row) if r >= 0
+            ]
+            for score_row, row_row in zip(scores, rows)
+        ]
+
+    def retrieve(self, question, k=12, q_vec=None):
+        if q_vec is None:
+            q_vec = embed([question])[0]
+        return self.search(q_vec[np.newaxis, :], k)[0]
+
+    def retrieve_batch(self, questions, k=12, q_vecs=None):
+        """One embedding pass + one FAISS search for many questions."""
+        if q_vecs is None:
+            q_vecs = embed(questions)
+        return self.search(q_vecs, k)
+
+    def vectors(self, rows):
+        """Stored vectors for FAISS rows, L2-normalized."""
+        vecs = np.vstack([self.faiss_index.reconstruct(int(r)) for r in rows])
+        return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
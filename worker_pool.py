@@ -0,0 +1,400 @@
+"""
+Supervised pool of pre-forked answer worker processes.
+
+The parent loads the index, chunk store, graphs and embedding model once
+(agent.warmup) and then forks ANSWER_PROCESSES workers. Forking after the
+load means the workers share those pages copy-on-write instead of each
+holding its own copy; with FAISS_MMAP on an IVF index and the mmap'd
+chunk store the big arrays are file-backed and shared anyway. Each
+worker answers on its own core, so retrieval, evidence selection and
+prompt building are no longer serialized by one GIL. The question
+embedding and the semantic answer cache stay in the parent, so all
+workers share one cache (agent.answer_question's `compute` hook).
+
+Supervision (monitor thread in the parent):
+- a worker that dies is re-forked; the job it was running is retried
+  up to WORKER_MAX_RETRIES times, then failed
+- a job running longer than WORKER_JOB_TIMEOUT gets its worker killed
+  (and the job failed)
+- idle workers heartbeat every WORKER_HEARTBEAT seconds; one that goes
+  silent is killed and re-forked
+
+Every worker talks to the parent over its own pair of pipes and jobs are
+assigned by the parent to idle workers, so no lock is shared between
+processes: a worker killed at any point cannot block the others.
+
+Metrics recorded in a worker (metrics.py) travel back with each result
+and heartbeat and are replayed into the parent's registry.
+
+When the parent's index is hot-reloaded, the next job forks a fresh
+generation from the new index and lets the old one drain.
+
+    pool = WorkerPool(4).start()
+    reply = pool.answer(sender, question)
+"""
+
+import os
+import sys
+import time
+import itertools
+import collections
+import threading
+import traceback
+import multiprocessing
+from multiprocessing.connection import wait
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from config import (
+    ANSWER_PROCESSES,
+    WORKER_HEARTBEAT,
+    WORKER_JOB_TIMEOUT,
+    WORKER_MAX_RETRIES,
+)
+from agent import current_kb, compute_answer, handle_question, warmup
+import metrics
+
+
+_ctx = multiprocessing.get_context("fork")
+
+
+# -----------------------------
+# Worker process
+# -----------------------------
+
+def _limit_threads(processes):
+    """Split the cores between workers instead of each using all of them."""
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(
+            max(1, (os.cpu_count() or 1) // processes)
+        )
+
+
+def _serve(tasks, results, processes):
+    """Worker process main loop (everything loaded is inherited)."""
+    pid = os.getpid()
+    _limit_threads(processes)
+
+    while True:
+        try:
+            if not tasks.poll(WORKER_HEARTBEAT):
+                results.send(("alive", pid, metrics.drain()))
+                continue
+            item = tasks.recv()
+        except (EOFError, OSError):
+            return                  # parent went away
+
+        if item is None:
+            return
+
+        job_id, question, q_vec = item
+        try:
+            with metrics.trace() as t:
+                response = compute_answer(question, current_kb(), q_vec)
+            result, error = (response, t.spans), None
+        except Exception as e:
+            traceback.print_exc()
+            result, error = None, repr(e)
+        results.send(("done", pid, job_id, result, error, metrics.drain()))
+
+
+# -----------------------------
+# Supervisor
+# -----------------------------
+
+class _Job:
+    __slots__ = ("future", "question", "q_vec", "attempts")
+
+    def __init__(self, question, q_vec):
+        self.future = Future()
+        self.question = question
+        self.q_vec = q_vec
+        self.attempts = 0
+
+
+class _Worker:
+    __slots__ = ("process", "tasks", "results", "job_id", "started",
+                 "seen", "retired", "kill_reason", "timed_out", "eof")
+
+    def __init__(self, process, tasks, results):
+        self.process = process
+        self.tasks = tasks          # pipe ends: parent -> worker
+        self.results = results      # and worker -> parent
+        self.job_id = None          # job currently assigned
+        self.started = 0.0
+        self.seen = time.monotonic()
+        self.retired = False        # old generation, exits when drained
+        self.kill_reason = None
+        self.timed_out = False      # killed for exceeding WORKER_JOB_TIMEOUT
+        self.eof = False            # results pipe closed by the worker
+
+    def idle(self):
+        return (self.job_id is None and not self.retired
+                and self.kill_reason is None)
+
+
+class WorkerPool:
+    def __init__(self, processes=ANSWER_PROCESSES):
+        self.processes = max(1, processes)
+        self.version = None
+
+        self.restarts = 0
+        self.crashes = 0
+        self.timeouts = 0
+        self.failed = 0
+
+        self._workers = {}                  # pid -> _Worker
+        self._jobs = {}                     # job id -> _Job
+        self._pending = collections.deque()  # job ids waiting for a worker
+        self._ids = itertools.count()
+        self._lock = threading.RLock()
+        self._closed = False
+
+    # -----------------------------
+    # lifecycle
+    # -----------------------------
+
+    def start(self):
+        # load in the parent, before any fork (no gateway thread here)
+        warmup(gateway=False)
+
+        with self._lock:
+            self._fork_generation()
+
+        for target, name in ((self._collect, "worker-pool-results"),
+                             (self._monitor, "worker-pool-monitor")):
+            threading.Thread(target=target, name=name, daemon=True).start()
+        return self
+
+    def _spawn(self):
+        task_r, task_w = _ctx.Pipe(duplex=False)
+        result_r, result_w = _ctx.Pipe(duplex=False)
+        p = _ctx.Process(
+            target=_serve,
+            args=(task_r, result_w, self.processes),
+            name="answer-worker",
+            daemon=True,
+        )
+        p.start()
+
+        # keep only the parent's ends, so a dead worker reads as EOF
+        task_r.close()
+        result_w.close()
+        self._workers[p.pid] = _Worker(p, task_w, result_r)
+        return p.pid
+
+    @staticmethod
+    def _send(w, item):
+        try:
+            w.tasks.send(item)
+        except OSError:
+            pass                    # worker gone; the monitor handles it
+
+    def _fork_generation(self):
+        """Fork a new set of workers from the currently loaded index."""
+        kb = current_kb()
+
+        # old generation: finish the job in hand, then exit
+        for w in self._workers.values():
+            if not w.retired:
+                w.retired = True
+                self._send(w, None)
+
+        self.version = kb.version
+        pids = [self._spawn() for _ in range(self.processes)]
+
+        print(f"👷 {len(pids)} answer workers forked "
+              f"(index version {kb.version}, pids {', '.join(map(str, pids))})")
+
+    def close(self, timeout=30):
+        with self._lock:
+            self._closed = True
+            workers = list(self._workers.values())
+            for w in workers:
+                if not w.retired:
+                    self._send(w, None)
+        for w in workers:
+            w.process.join(timeout)
+
+    # -----------------------------
+    # jobs
+    # -----------------------------
+
+    def _submit(self, question, q_vec):
+        job = _Job(question, q_vec)
+        with self._lock:
+            # index hot-reloaded in the parent -> re-fork from it
+            if current_kb().version != self.version:
+                self._fork_generation()
+
+            job_id = next(self._ids)
+            self._jobs[job_id] = job
+            self._pending.append(job_id)
+            self._assign()
+        return job_id, job.future
+
+    def compute(self, question, kb, q_vec, hits=None, priority=None, timeout=None):
+        """
+        agent.compute_answer() in a worker process (answer_question's
+        `compute` hook). Gives up after `timeout` seconds (default: every
+        allowed attempt timing out).
+        """
+        if timeout is None:
+            timeout = WORKER_JOB_TIMEOUT * (WORKER_MAX_RETRIES + 2)
+
+        job_id, future = self._submit(question, q_vec)
+        try:
+            response, spans = future.result(timeout)
+        except FutureTimeout:
+            with self._lock:
+                self._finish(job_id, error=f"no answer within {timeout}s")
+            raise
+
+        metrics.extend_trace(spans)
+        return response
+
+    def answer(self, sender, question) -> str:
+        """
+        handle_question() with the pipeline run in a worker process. The
+        question embedding and the answer cache stay in this process, so
+        every worker shares one cache.
+        """
+        return handle_question(sender, question, compute=self.compute)
+
+    def _assign(self):
+        """Hand pending jobs to idle workers (call with the lock held)."""
+        idle = [w for w in self._workers.values() if w.idle()]
+        while self._pending and idle:
+            job_id = self._pending.popleft()
+            job = self._jobs.get(job_id)
+            if job is None:
+                continue            # given up on while pending
+
+            w = idle.pop()
+            job.attempts += 1
+            w.job_id, w.started = job_id, time.monotonic()
+            self._send(w, (job_id, job.question, job.q_vec))
+
+    def _finish(self, job_id, reply=None, error=None):
+        job = self._jobs.pop(job_id, None)
+        if job is None:
+            return
+        if error is None:
+            job.future.set_result(reply)
+        else:
+            self.failed += 1
+            job.future.set_exception(RuntimeError(f"answer worker failed: {error}"))
+
+    def _collect(self):
+        while not self._closed:
+            with self._lock:
+                conns = [w.results for w in self._workers.values() if not w.eof]
+            try:
+                ready = wait(conns, timeout=1.0)
+            except (OSError, ValueError):
+                continue            # a pipe was closed meanwhile
+
+            with self._lock:
+                for w in list(self._workers.values()):
+                    if w.results in ready:
+                        self._read(w)
+                self._assign()
+
+    def _read(self, w):
+        """Handle every message `w` has sent (call with the lock held)."""
+        try:
+            while w.results.poll():
+                msg = w.results.recv()
+                metrics.replay(msg[-1])
+                w.seen = time.monotonic()
+
+                if msg[0] == "done":
+                    if w.job_id == msg[2]:
+                        w.job_id = None
+                    self._finish(msg[2], msg[3], msg[4])
+        except (EOFError, OSError):
+            w.eof = True            # worker died; the monitor handles it
+
+    # -----------------------------
+    # health checks
+    # -----------------------------
+
+    def _monitor(self):
+        while True:
+            time.sleep(max(1.0, WORKER_HEARTBEAT / 2))
+            with self._lock:
+                if self._closed:
+                    return
+                for pid, w in list(self._workers.items()):
+                    self._check(pid, w)
+                self._assign()
+
+    def _check(self, pid, w):
+        now = time.monotonic()
+
+        if not w.process.is_alive():
+            del self._workers[pid]
+            self._on_exit(pid, w)
+            return
+
+        timed_out = w.job_id is not None and now - w.started > WORKER_JOB_TIMEOUT
+        if timed_out:
+            reason = f"job {w.job_id} exceeded {WORKER_JOB_TIMEOUT}s"
+        elif w.job_id is None and now - w.seen > 3 * WORKER_HEARTBEAT:
+            reason = f"no heartbeat for {now - w.seen:.0f}s"
+        else:
+            return
+
+        # killed here, cleaned up and replaced on the next check
+        if w.kill_reason is None:
+            print(f"⏱️ Answer worker {pid}: {reason}; killing it")
+            w.kill_reason = reason
+            w.timed_out = timed_out
+            w.process.kill()
+
+    def _on_exit(self, pid, w):
+        code = w.process.exitcode
+        self._read(w)               # a result sent just before exiting
+        w.tasks.close()
+        w.results.close()
+        if w.retired and code == 0 and w.job_id is None:
+            return      # drained old generation
+
+        if w.timed_out:
+            self.timeouts += 1
+        else:
+            self.crashes += 1
+        print(f"💥 Answer worker {pid} exited (code {code}"
+              f"{', ' + w.kill_reason if w.kill_reason else ''})")
+
+        if w.job_id is not None:
+            self._job_lost(w.job_id, w)
+
+        if not w.retired and not self._closed:
+            self._spawn()
+            self.restarts += 1
+
+    def _job_lost(self, job_id, w):
+        """The worker running `job_id` died: retry it or fail it."""
+        job = self._jobs.get(job_id)
+        if job is None:
+            return
+
+        # a job that timed out would most likely time out again
+        if not w.timed_out and job.attempts <= WORKER_MAX_RETRIES:
+            print(f"🔁 Retrying job {job_id} (attempt {job.attempts + 1})")
+            self._pending.appendleft(job_id)
+        else:
+            self._finish(job_id, error=w.kill_reason
+                         or f"exit code {w.process.exitcode}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": sum(1 for w in self._workers.values() if not w.retired),
+                "busy": sum(1 for w in self._workers.values() if w.job_id is not None),
+                "pending": sum(1 for j in self._pending if j in self._jobs),
+                "restarts": self.restarts,
+                "crashes": self.crashes,
+                "timeouts": self.timeouts,
+                "failed": self.failed,
+            }